@@ -1,20 +1,124 @@
-import logging
+import asyncio
+import functools
 import platform
+from concurrent.futures import ThreadPoolExecutor
 from time import sleep
+from urllib.parse import urlsplit
 
+import aiohttp
 import requests
 import urllib3
 from loguru import logger
 from requests.exceptions import ProxyError, SSLError
 from selenium import webdriver
+from selenium.common.exceptions import TimeoutException
 from selenium.webdriver import Proxy
+from selenium.webdriver.common.by import By
 from selenium.webdriver.common.proxy import ProxyType
 from selenium.webdriver.chrome.service import Service as ChromeService
 from selenium.webdriver.firefox.service import Service as FirefoxService
+from selenium.webdriver.support import expected_conditions
+from selenium.webdriver.support.ui import WebDriverWait
 from webdriver_manager.chrome import ChromeDriverManager
 from webdriver_manager.firefox import GeckoDriverManager
 
-from app.settings import PARSED_CONFIG
+from app.settings import PARSED_CONFIG, BrowserConfig, HttpConfig
+
+# the forecast is rendered (JavaScript) when the day blocks are present
+FORECAST_READY = (By.CSS_SELECTOR, '[class*="AppForecastDay_container"]')
+
+
+class AsyncPageFetcher:
+    """
+    Asynchronous page loader on a shared keep-alive connection pool
+    (same PROXY / SSL fallback as `get_page_content`)
+    """
+
+    def __init__(self, config: HttpConfig = PARSED_CONFIG.http, proxy: str = PARSED_CONFIG.proxy):
+        self.config = config
+        self.proxy = proxy or None
+        self._session: aiohttp.ClientSession | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._host_limits: dict[str, asyncio.Semaphore] = {}
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # the pool (and its per-host limits) belongs to a single event loop
+            await self._session_release()
+            self._loop, self._host_limits = loop, {}
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.config.pool_size,
+                limit_per_host=self.config.per_host_limit,
+                keepalive_timeout=self.config.keepalive_timeout,
+                ttl_dns_cache=300,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.config.timeout),
+                headers={"User-Agent": self.config.user_agent},
+            )
+        return self._session
+
+    async def _session_release(self):
+        # the pool of the previous loop: closed on that loop while it still runs (another thread),
+        # otherwise here - the connector drops its connections and the session is not leaked
+        session, self._session = self._session, None
+        if session is None or session.closed:
+            return
+        if self._loop is not None and self._loop.is_running():
+            asyncio.run_coroutine_threadsafe(session.close(), self._loop)
+        else:
+            await session.close()
+
+    def _host_limit(self, url: str) -> asyncio.Semaphore:
+        host = urlsplit(url).netloc
+        if host not in self._host_limits:
+            self._host_limits[host] = asyncio.Semaphore(self.config.per_host_limit)
+        return self._host_limits[host]
+
+    async def get(self, url: str) -> str:
+        session = await self._get_session()
+        proxy = self.proxy
+        verify = True
+        async with self._host_limit(url):
+            for attempt in range(self.config.retries):
+                try:
+                    async with session.get(url, proxy=proxy, ssl=None if verify else False) as page:
+                        if page.status != 200:
+                            return ""
+                        content = await page.read()
+                except (aiohttp.ClientProxyConnectionError, aiohttp.ClientHttpProxyError):
+                    if proxy:
+                        logger.info(f"ProxyError: Switch-Off PROXY {self.proxy}")
+                        proxy = None
+                    else:
+                        raise
+                except aiohttp.ClientSSLError:
+                    if verify:
+                        logger.info("SSLError: Switch-Off `verify`")
+                        verify = False
+                    else:
+                        raise
+                else:
+                    try:
+                        return content.decode("utf-8")
+                    except UnicodeDecodeError:
+                        return ""
+        return ""
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+
+page_fetcher = AsyncPageFetcher()
+
+
+async def fetch_page_content(url: str) -> str:
+    return await page_fetcher.get(url)
 
 
 def get_page_content(url: str, is_with_session: bool = False):
@@ -96,7 +200,7 @@ def get_page_content_with_wait(url: str, wait_sec: int = 20):
         browser = webdriver.Firefox(options=options)
         # browser = webdriver.Firefox(options=options)
     else:
-        browser = webdriver.Firefox(service=FirefoxService(GeckoDriverManager().install()), options=options)
+        browser = webdriver.Firefox(service=FirefoxService(_driver_path("firefox")), options=options)
         # service = webdriver.FirefoxService(executable_path="app/driver/geckodriver")
         # browser = webdriver.Firefox(options=options, service=service)
 
@@ -190,22 +294,21 @@ def get_page_content_by_chrome(url: str, wait_sec: int = 20):
         browser = webdriver.Chrome(options=options)
     else:
         try:
-            service = ChromeService(ChromeDriverManager().install())
+            service = ChromeService(_driver_path("chrome"))
         except Exception as err:
-            logging.ERROR(f"service = ChromeService(ChromeDriverManager().install()): {err}")
+            logger.error(f"service = ChromeService(ChromeDriverManager().install()): {err}")
             raise
         try:
             browser = webdriver.Chrome(service=service, options=options)
         except Exception as err:
-            logging.ERROR(f"browser = webdriver.Firefox(service=service, options=options): {err}")
+            logger.error(f"browser = webdriver.Chrome(service=service, options=options): {err}")
             raise
     try:
         # Set the implicit wait time
         browser.implicitly_wait(wait_sec)
         browser.get(url)
         # waiting for the elements that are created using JavaScript
-        sleep(wait_sec)
-        page_content = browser.page_source
+        page_content = wait_page_ready(browser, wait_sec)
     except Exception as err:
         logger.error(err)
         raise
@@ -213,3 +316,130 @@ def get_page_content_by_chrome(url: str, wait_sec: int = 20):
     browser.quit()
     return page_content
 
+
+@functools.lru_cache
+def _driver_path(browser: str) -> str:
+    """webdriver-manager looks for (downloads) the driver once per process"""
+    return (GeckoDriverManager() if browser == "firefox" else ChromeDriverManager()).install()
+
+
+def wait_page_ready(browser, wait_sec: int, locator: tuple = FORECAST_READY) -> str:
+    """Page source as soon as the `locator` element is present (at most `wait_sec`)"""
+    try:
+        WebDriverWait(browser, wait_sec).until(expected_conditions.presence_of_element_located(locator))
+    except TimeoutException:
+        logger.info(f"The page is not ready in {wait_sec} sec: {browser.current_url}")
+    return browser.page_source
+
+
+def create_browser(browser: str = "firefox"):
+    """New headless Firefox / Chrome"""
+    is_firefox = browser == "firefox"
+    options = webdriver.FirefoxOptions() if is_firefox else webdriver.ChromeOptions()
+    if PARSED_CONFIG.proxy:
+        options.add_argument(f"--proxy-server={PARSED_CONFIG.proxy}")
+    options.add_argument('--headless')
+    options.add_argument("--ignore-certificate-errors")
+    if is_firefox:
+        options.set_preference("accept_insecure_certs", True)
+
+    if platform.system() == "Windows":
+        return webdriver.Firefox(options=options) if is_firefox else webdriver.Chrome(options=options)
+    if is_firefox:
+        return webdriver.Firefox(service=FirefoxService(_driver_path("firefox")), options=options)
+    return webdriver.Chrome(service=ChromeService(_driver_path("chrome")), options=options)
+
+
+class _BrowserSession:
+    def __init__(self, driver):
+        self.driver = driver
+        self.pages = 0
+
+
+class BrowserPool:
+    """
+    Long-lived headless browsers, checked out per request
+    and recycled after `max_pages` pages or on a crash
+    """
+
+    def __init__(self, config: BrowserConfig = PARSED_CONFIG.browser):
+        self.config = config
+        # `pool_size` slots: an idle session or None (the browser is not started yet / was recycled)
+        self._slots: asyncio.Queue | None = None
+        self._executor = ThreadPoolExecutor(max_workers=config.pool_size, thread_name_prefix="browser")
+        self.pages = 0
+        self.recycled = 0
+        self.crashed = 0
+
+    def _run(self, fn, *args) -> asyncio.Future:
+        return asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def _get_slots(self) -> asyncio.Queue:
+        if self._slots is None:
+            self._slots = asyncio.Queue()
+            for _ in range(self.config.pool_size):
+                self._slots.put_nowait(None)
+        return self._slots
+
+    async def _checkout(self) -> _BrowserSession:
+        session = await self._get_slots().get()
+        if session is None:
+            try:
+                session = _BrowserSession(await self._run(create_browser, self.config.browser))
+            except BaseException:
+                self._slots.put_nowait(None)
+                raise
+        return session
+
+    async def _discard(self, session: _BrowserSession, running: asyncio.Future = None):
+        if running is not None:
+            # the caller was cancelled while the thread still drives the page: quit after the thread is done
+            await asyncio.wait([running])
+        try:
+            await self._run(session.driver.quit)
+        except Exception as err:
+            logger.error(f"browser quit: {err}")
+        self._slots.put_nowait(None)
+
+    def _load(self, driver, url: str, locator: tuple) -> str:
+        driver.get(url)
+        return wait_page_ready(driver, self.config.wait_sec, locator)
+
+    async def get(self, url: str, locator: tuple = FORECAST_READY) -> str:
+        session = await self._checkout()
+        running = self._run(self._load, session.driver, url, locator)
+        try:
+            page_content = await asyncio.shield(running)
+        except BaseException as err:
+            self.crashed += 1
+            logger.error(f"browser page `{url}`: {err}")
+            # shielded: a second cancel does not leave the slot (and the browser) behind
+            await asyncio.shield(self._discard(session, running))
+            raise
+        self.pages += 1
+        session.pages += 1
+        if session.pages >= self.config.max_pages:
+            self.recycled += 1
+            await self._discard(session)
+        else:
+            self._slots.put_nowait(session)
+        return page_content
+
+    async def close(self):
+        if self._slots is None:
+            return
+        while not self._slots.empty():
+            session = self._slots.get_nowait()
+            if session is not None:
+                await self._run(session.driver.quit)
+        self._slots = None
+
+    def stats(self) -> dict:
+        return {"pages": self.pages, "recycled": self.recycled, "crashed": self.crashed}
+
+
+browser_pool = BrowserPool()
+
+
+async def fetch_page_content_by_browser(url: str) -> str:
+    return await browser_pool.get(url)
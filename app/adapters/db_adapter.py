@@ -1 +1,437 @@
-import datetimeimport sqlite3from app.adapters.yandex import get_yandex_weatherfrom app.settings import PARSED_CONFIGclass WeatherParser(object):    """        Class for working with DataBase (sQlite)    """    user_field = ["id", "user_name", "user_id", "date_last"]    log_field = ["id", "user_id", "date_time", "city", "is_success", "message"]    city_field = ["id", "name_ru", "name_en"]    user_city_field = ["id", "user_id", "date_last", "city"]    def __init__(self):        # Создаем подключение к базе данных (файл my_database.db будет создан)        # Устанавливаем соединение с базой данных        connection = sqlite3.connect(PARSED_CONFIG.sqlite_db)        cursor = connection.cursor()        # Создаем таблицу Users        cursor.execute('''            CREATE TABLE IF NOT EXISTS User (                id INTEGER PRIMARY KEY,                user_name TEXT NOT NULL,                user_id INTEGER,                date_last timestamp            )        '''        )        # User-defined type        sqlite3.register_adapter(bool, int)        sqlite3.register_converter("BOOL", lambda v: bool(int(v)))        # Создаем таблицу Log        cursor.execute('''            CREATE TABLE IF NOT EXISTS Log (                id INTEGER PRIMARY KEY,                user_id INTEGER,                date_time timestamp,                city TEXT NOT NULL,                is_success BOOL,                message TEXT            )        '''                       )        # Создаем таблицу City        cursor.execute('''            CREATE TABLE IF NOT EXISTS City (                id INTEGER PRIMARY KEY,                name_ru TEXT NOT NULL,                name_en TEXT NOT NULL            )        '''                       )        # Создаем таблицу User_City        cursor.execute('''            CREATE TABLE IF NOT EXISTS User_City (                id INTEGER PRIMARY KEY,                user_id INTEGER,                date_last timestamp,                city TEXT NOT NULL            )        '''                       )        # Сохраняем изменения и закрываем соединение        connection.commit()        connection.close()    async def user_add(self, user_id: int, user_name: str = "") -> dict:        user_old = await self.user_get(self, user_id)        if user_old:            await self.user_update(self, user_id, user_name)        else:            connection = sqlite3.connect(PARSED_CONFIG.sqlite_db)            cursor = connection.cursor()            cursor.execute(f'INSERT INTO User (user_name, user_id, date_last) '                           f'VALUES ("{user_name}", {user_id}, "{datetime.datetime.now()}")')            connection.commit()            connection.close()        return await self.user_get(self, user_id)    async def user_get(self, user_id: int) -> dict:        connection = sqlite3.connect(PARSED_CONFIG.sqlite_db)        cursor = connection.cursor()        fields = ",".join(self.user_field)        cursor.execute(f'SELECT {fields} FROM User WHERE user_id == {user_id}')        result = cursor.fetchone()        connection.close()        return {key: val for key, val in zip(self.user_field, result)} if result else None    async def user_update(self, user_id: int, user_name: str = None) -> dict:        user_old = await self.user_get(self, user_id)        if user_old:            user_name = user_name if user_name else user_old["user_name"]            connection = sqlite3.connect(PARSED_CONFIG.sqlite_db)            cursor = connection.cursor()            # Обновляем пользователя            cursor.execute(                f"""                    UPDATE User                    SET user_name = "{user_name}", date_last = "{datetime.datetime.now()}"                    WHERE user_id = {user_id}                """            )            # Сохраняем изменения и закрываем соединение            connection.commit()            connection.close()        else:            await self.user_add(user_id, (user_name or ""))        return await self.user_get(self, user_id)    @staticmethod    async def log_add(user_id: int, city: str = "", is_success: bool = True, message: str = ""):        connection = sqlite3.connect(PARSED_CONFIG.sqlite_db)        connection.execute('INSERT INTO Log (user_id, date_time, city, is_success, message) VALUES (?, ?, ?, ?, ?)',                       (user_id, datetime.datetime.now(), city, is_success, message))        connection.commit()        connection.close()    async def log_get(self, limit: int = 10) -> list[dict]:        connection = sqlite3.connect(PARSED_CONFIG.sqlite_db)        cursor = connection.cursor()        fields = ",".join(self.log_field)        cursor.execute(f'SELECT {fields} FROM Log ORDER BY id DESC LIMIT {limit}')        result = cursor.fetchall()        connection.close()        return [{key: not bool(val) if key.startswith("is_") else val for key, val in zip(self.log_field, log)} for log in result] if result else None    @staticmethod    async def city_add(name_ru: str, name_en: str):        connection = sqlite3.connect(PARSED_CONFIG.sqlite_db)        cursor = connection.cursor()        cursor.execute(f'INSERT INTO City (name_ru, name_en) VALUES ("{name_ru}", "{name_en}")')        connection.commit()        connection.close()    async def city_get(self, name_ru: str = "") -> list[dict]:        connection = sqlite3.connect(PARSED_CONFIG.sqlite_db)        cursor = connection.cursor()        fields = ",".join(self.city_field)        cursor.execute(f'SELECT {fields} FROM City WHERE name_ru LIKE "%{name_ru.lower()}%"')        result = cursor.fetchall()        connection.close()        print(f"city_get {name_ru}")        return [{key: val for key, val in zip(self.city_field, city)} for city in result] if result else None    async def user_city_add_or_update(self, user_id: int, city: str):        connection = sqlite3.connect(PARSED_CONFIG.sqlite_db)        cursor = connection.cursor()        fields = ",".join(self.user_city_field)        sql_command = f'SELECT {fields} FROM User_City WHERE user_id == {user_id} AND city == "{city}"'        cursor.execute(sql_command)        result = cursor.fetchone()        if result:            sql_command = (f'UPDATE User_City SET date_last = "{datetime.datetime.now()}" '                           f'WHERE user_id == {user_id} AND city == "{city}"')        else:            sql_command = (f'INSERT INTO User_City (user_id, city, date_last) '                           f'VALUES ({user_id}, "{city}", "{datetime.datetime.now()}")')        cursor.execute(sql_command)        connection.commit()        connection.close()    @staticmethod    async def user_city_get(user_id: int) -> list[dict]:        connection = sqlite3.connect(PARSED_CONFIG.sqlite_db)        cursor = connection.cursor()        fields_list = ["user_id", "name_en", "name_ru"]        fields = ", ".join(fields_list)        sql_command = (f'SELECT {fields} FROM User_City u JOIN City c ON u.city == c.name_en '                       f'WHERE user_id == {user_id} ORDER BY date_last DESC LIMIT 10')        cursor.execute(sql_command)        result = cursor.fetchall()        connection.close()        return [{key: val for key, val in zip(fields_list, city)} for city in result] if result else None    async def weather_get(self, user_id: int, city: str) -> dict:        result = await get_yandex_weather(city.lower())        await self.log_add(user_id, city, result["is_error"], result["message"])        if not result["is_error"]:            await self.user_city_add_or_update(self, user_id, city)        return result
\ No newline at end of file
+import asyncio
+import datetime
+import sqlite3
+
+from loguru import logger
+from pandas import DataFrame
+
+from app.adapters.sqlite_pool import AsyncSQLitePool
+from app.adapters.yandex import forecast_frame, get_yandex_weather
+from app.settings import PARSED_CONFIG
+from app.utils.cache import AsyncTTLCache
+from app.utils.city_index import CityIndex
+
+forecast_cache = AsyncTTLCache(ttl=PARSED_CONFIG.forecast_cache.ttl_sec, max_size=PARSED_CONFIG.forecast_cache.max_size)
+user_prefs_cache = AsyncTTLCache(
+    ttl=PARSED_CONFIG.user_prefs_cache.ttl_sec, max_size=PARSED_CONFIG.user_prefs_cache.max_size
+)
+
+
+class WeatherParser(object):
+    """
+        Class for working with DataBase (sQlite)
+    """
+    user_field = ["id", "user_name", "user_id", "date_last", "menu_scale"]
+    # preferences of the user -> the value of the unknown user
+    user_prefs_field = {"menu_scale": 0}
+    log_field = ["id", "user_id", "date_time", "city", "is_success", "message"]
+    # column types of the Log export (parquet / arrow): a chunk may have only NULL messages
+    log_export_schema = {
+        "id": "int64",
+        "user_id": "int64",
+        "date_time": "string",
+        "city": "string",
+        "is_success": "bool",
+        "message": "string",
+    }
+    city_field = ["id", "name_ru", "name_en"]
+    user_city_field = ["id", "user_id", "date_last", "city"]
+    # Forecast table field -> column of the forecast DataFrame
+    forecast_field = {
+        "date": "Дата",
+        "part_day": "Время суток",
+        "temperature": "Температура",
+        "temperature_avg": "Средняя температура за световой день",
+        "pressure": "Давление",
+        "pressure_text": "Давление (комментарий)",
+        "wetness": "Влажность",
+        "event": "Погодное явление",
+        "magnetic_field": "Магнитное поле",
+    }
+    index_sql = (
+        'CREATE INDEX IF NOT EXISTS ix_user_user_id ON User (user_id)',
+        'CREATE INDEX IF NOT EXISTS ix_log_user_id ON Log (user_id)',
+        'CREATE INDEX IF NOT EXISTS ix_log_date_time ON Log (date_time)',
+        'CREATE INDEX IF NOT EXISTS ix_user_city_user_id_city ON User_City (user_id, city)',
+        'CREATE INDEX IF NOT EXISTS ix_city_name_ru ON City (name_ru)',
+        'CREATE INDEX IF NOT EXISTS ix_city_name_en ON City (name_en)',
+        'CREATE INDEX IF NOT EXISTS ix_city_region_name_ru ON City (region, name_ru)',
+        'CREATE INDEX IF NOT EXISTS ix_forecast_city_fetched ON Forecast (city, fetched_at)',
+    )
+
+    def __init__(self, sqlite_db: str = PARSED_CONFIG.sqlite_db, readers: int = PARSED_CONFIG.sqlite_readers):
+        self.pool = AsyncSQLitePool(sqlite_db, readers=readers)
+        self.city_index = CityIndex()
+        self._city_buckets: list[dict] = None  # groups of the City keyboard, see `city_buckets_get`
+        # Создаем подключение к базе данных (файл my_database.db будет создан)
+        # Устанавливаем соединение с базой данных
+        connection = sqlite3.connect(sqlite_db)
+        cursor = connection.cursor()
+        # Создаем таблицу Users
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS User (
+                id INTEGER PRIMARY KEY,
+                user_name TEXT NOT NULL,
+                user_id INTEGER,
+                date_last timestamp
+            )
+        '''
+        )
+        # User-defined type
+        sqlite3.register_adapter(bool, int)
+        sqlite3.register_converter("BOOL", lambda v: bool(int(v)))
+
+        # Создаем таблицу Log
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS Log (
+                id INTEGER PRIMARY KEY,
+                user_id INTEGER,
+                date_time timestamp,
+                city TEXT NOT NULL,
+                is_success BOOL,
+                message TEXT
+            )
+        '''
+                       )
+        # Создаем таблицу City
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS City (
+                id INTEGER PRIMARY KEY,
+                name_ru TEXT NOT NULL,
+                name_en TEXT NOT NULL
+            )
+        '''
+                       )
+        # Создаем таблицу User_City
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS User_City (
+                id INTEGER PRIMARY KEY,
+                user_id INTEGER,
+                date_last timestamp,
+                city TEXT NOT NULL
+            )
+        '''
+                       )
+        # Создаем таблицу Forecast (последний разобранный прогноз по городу)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS Forecast (
+                id INTEGER PRIMARY KEY,
+                city TEXT NOT NULL,
+                fetched_at timestamp,
+                row_num INTEGER,
+                date TEXT,
+                part_day TEXT,
+                temperature INTEGER,
+                temperature_avg REAL,
+                pressure INTEGER,
+                pressure_text TEXT,
+                wetness TEXT,
+                event TEXT,
+                magnetic_field TEXT
+            )
+        '''
+                       )
+        # Resumable points of the dialogs (flow, step) between the restarts of the bot
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS Dialog_State (
+                chat_id INTEGER PRIMARY KEY,
+                flow TEXT NOT NULL,
+                step INTEGER,
+                date_last timestamp
+            )
+        '''
+                       )
+        # Миграция: колонки, добавленные после создания таблицы
+        user_columns = {row[1] for row in cursor.execute('PRAGMA table_info(User)')}
+        if "menu_scale" not in user_columns:
+            cursor.execute('ALTER TABLE User ADD COLUMN menu_scale INTEGER DEFAULT 0')
+        city_columns = {row[1] for row in cursor.execute('PRAGMA table_info(City)')}
+        if city_columns and "region" not in city_columns:
+            cursor.execute('ALTER TABLE City ADD COLUMN region TEXT')
+        # Индексы под выборки бота
+        for index_sql in self.index_sql:
+            cursor.execute(index_sql)
+        # Сохраняем изменения и закрываем соединение
+        connection.commit()
+        connection.close()
+
+    def close(self):
+        self.pool.close()
+
+    async def user_add(self, user_id: int, user_name: str = "") -> dict:
+        def _user_add(connection: sqlite3.Connection):
+            now = str(datetime.datetime.now())
+            # an empty name (the callers pass `user_name or ""`) keeps the stored one
+            cursor = connection.execute(
+                "UPDATE User SET user_name = COALESCE(NULLIF(?, ''), user_name), date_last = ? WHERE user_id == ?",
+                (user_name, now, user_id),
+            )
+            if not cursor.rowcount:
+                connection.execute('INSERT INTO User (user_name, user_id, date_last) VALUES (?, ?, ?)',
+                                   (user_name or "", user_id, now))
+
+        await self.pool.transaction(_user_add)
+        return await self._user_prefs_refresh(user_id)
+
+    async def user_get(self, user_id: int) -> dict:
+        fields = ",".join(self.user_field)
+        result = await self.pool.fetch_one(f'SELECT {fields} FROM User WHERE user_id == ?', (user_id,))
+        return {key: val for key, val in zip(self.user_field, result)} if result else None
+
+    async def user_update(self, user_id: int, user_name: str = None, menu_scale: int = None) -> dict:
+        if menu_scale is None:
+            return await self.user_add(user_id, (user_name or ""))
+        await self.user_add(user_id, (user_name or ""))
+        await self.pool.execute('UPDATE User SET menu_scale = ? WHERE user_id == ?', (menu_scale, user_id))
+        return await self._user_prefs_refresh(user_id)
+
+    async def user_prefs_get(self, user_id: int) -> dict:
+        """
+            Preferences of the user (`user_prefs_field`), cached; the writes of the user refresh the cache
+        """
+        return await user_prefs_cache.get_or_load(user_id, self._user_prefs_load, user_id)
+
+    async def _user_prefs_load(self, user_id: int) -> dict:
+        return self._user_prefs(await self.user_get(user_id))
+
+    async def _user_prefs_refresh(self, user_id: int) -> dict:
+        user = await self.user_get(user_id)
+        user_prefs_cache.set(user_id, self._user_prefs(user))
+        return user
+
+    @classmethod
+    def _user_prefs(cls, user: dict = None) -> dict:
+        user = user or {}
+        return {key: default if user.get(key) is None else user[key] for key, default in cls.user_prefs_field.items()}
+
+    async def log_add(self, user_id: int, city: str = "", is_success: bool = True, message: str = ""):
+        await self.pool.execute(
+            'INSERT INTO Log (user_id, date_time, city, is_success, message) VALUES (?, ?, ?, ?, ?)',
+            (user_id, str(datetime.datetime.now()), city, is_success, message),
+        )
+
+    async def log_get(self, limit: int = 10) -> list[dict]:
+        fields = ",".join(self.log_field)
+        result = await self.pool.fetch_all(f'SELECT {fields} FROM Log ORDER BY id DESC LIMIT ?', (limit,))
+        return [{key: not bool(val) if key.startswith("is_") else val for key, val in zip(self.log_field, log)} for log in result] if result else None
+
+    async def log_iter(self, chunk_size: int = 5000):
+        """
+            The whole Log as DataFrame chunks (keyset pagination by `id`) - for the export
+        """
+        fields = ",".join(self.log_field)
+        last_id = -1
+        while True:
+            result = await self.pool.fetch_all(
+                f'SELECT {fields} FROM Log WHERE id > ? ORDER BY id LIMIT ?', (last_id, chunk_size)
+            )
+            if not result:
+                return
+            df = DataFrame(result, columns=self.log_field)
+            yield df.assign(**{key: ~df[key].astype(bool) for key in self.log_field if key.startswith("is_")})
+            last_id = result[-1][self.log_field.index("id")]
+            if len(result) < chunk_size:
+                return
+
+    async def city_popular_get(self, limit: int = 20, window_hours: int = 24) -> list[str]:
+        """
+            The most requested directory cities for the last `window_hours` (successful requests in Log + User_City)
+        """
+        since = str(datetime.datetime.now() - datetime.timedelta(hours=window_hours))
+        # the Log.is_success column keeps `is_error` (see `weather_get`), successful requests have 0
+        result = await self.pool.fetch_all(
+            'SELECT city, SUM(hits) AS hits FROM ('
+            '   SELECT city, COUNT(*) AS hits FROM Log WHERE date_time >= ? AND is_success == 0 GROUP BY city'
+            '   UNION ALL'
+            '   SELECT city, COUNT(*) AS hits FROM User_City WHERE date_last >= ? GROUP BY city'
+            ') WHERE city IN (SELECT name_en FROM City) GROUP BY city ORDER BY hits DESC LIMIT ?',
+            (since, since, limit),
+        )
+        return [city for city, hits in result]
+
+    async def city_add(self, name_ru: str, name_en: str, region: str = None):
+        city_id = await self.pool.execute('INSERT INTO City (name_ru, name_en, region) VALUES (?, ?, ?)',
+                                          (name_ru, name_en, region))
+        self._city_buckets = None
+        if len(self.city_index):
+            self.city_index.add({"id": city_id, "name_ru": name_ru, "name_en": name_en})
+
+    async def city_index_load(self):
+        """
+            Build the in-memory City index (once at startup)
+        """
+        self.city_index.build(await self.city_get() or [])
+        logger.info(f"City index is built: {len(self.city_index)} cities")
+
+    async def city_find(self, name: str, limit: int = 20) -> list[dict]:
+        """
+            Ranked lookup by the first letters / part / misspelled name (russian or english)
+        """
+        if not len(self.city_index):
+            await self.city_index_load()
+        return self.city_index.search(name, limit=limit) or None
+
+    async def city_get(self, name_ru: str = "") -> list[dict]:
+        # `rowid` - the City table may be loaded from CSV (`to_sql`) without the `id` column
+        result = await self.pool.fetch_all(
+            'SELECT rowid, name_ru, name_en FROM City WHERE name_ru LIKE ? ORDER BY name_ru',
+            (f"%{name_ru.lower()}%",),
+        )
+        return [{key: val for key, val in zip(self.city_field, city)} for city in result] if result else None
+
+    async def city_buckets_get(self) -> list[dict]:
+        """
+            Groups of the City directory for the paged keyboard: by region (`Federal subject`),
+            by the first letter of `name_ru` if the regions are not loaded; [{"region" | "letter", "count"}]
+        """
+        if self._city_buckets is None:
+            result = await self.pool.fetch_all('SELECT region, COUNT(*) FROM City GROUP BY region ORDER BY region')
+            if any(region is not None for region, count in result):
+                self._city_buckets = [{"region": region, "count": count} for region, count in result]
+            else:
+                result = await self.pool.fetch_all(
+                    'SELECT substr(name_ru, 1, 1) AS letter, COUNT(*) FROM City GROUP BY letter ORDER BY letter'
+                )
+                self._city_buckets = [{"letter": letter, "count": count} for letter, count in result if letter]
+        return self._city_buckets
+
+    async def city_page_get(self, bucket: dict, offset: int, limit: int) -> list[dict]:
+        """
+            One page of the cities of the group (`city_buckets_get`) ordered by `name_ru`
+        """
+        fields = "rowid, name_ru, name_en"
+        if "region" in bucket:
+            # `IS` - the cities without region are the group too
+            result = await self.pool.fetch_all(
+                f'SELECT {fields} FROM City WHERE region IS ? ORDER BY name_ru LIMIT ? OFFSET ?',
+                (bucket["region"], limit, offset),
+            )
+        else:
+            # the range of the index instead of LIKE 'x%' (LIKE is case-insensitive and skips the index)
+            letter = bucket["letter"]
+            result = await self.pool.fetch_all(
+                f'SELECT {fields} FROM City WHERE name_ru >= ? AND name_ru < ? ORDER BY name_ru LIMIT ? OFFSET ?',
+                (letter, chr(ord(letter) + 1), limit, offset),
+            )
+        return [{key: val for key, val in zip(self.city_field, city)} for city in result]
+
+    async def user_city_add_or_update(self, user_id: int, city: str):
+        def _user_city_add_or_update(connection: sqlite3.Connection):
+            now = str(datetime.datetime.now())
+            cursor = connection.execute('UPDATE User_City SET date_last = ? WHERE user_id == ? AND city == ?',
+                                        (now, user_id, city))
+            if not cursor.rowcount:
+                connection.execute('INSERT INTO User_City (user_id, city, date_last) VALUES (?, ?, ?)',
+                                   (user_id, city, now))
+
+        await self.pool.transaction(_user_city_add_or_update)
+
+    async def dialog_state_save(self, points: list[tuple[int, str, int]]):
+        def _dialog_state_save(connection: sqlite3.Connection):
+            now = str(datetime.datetime.now())
+            connection.execute('DELETE FROM Dialog_State')
+            connection.executemany('INSERT INTO Dialog_State (chat_id, flow, step, date_last) VALUES (?, ?, ?, ?)',
+                                   [(chat_id, flow, step, now) for chat_id, flow, step in points])
+
+        await self.pool.transaction(_dialog_state_save)
+
+    async def dialog_state_get(self) -> list[tuple[int, str, int]]:
+        return await self.pool.fetch_all('SELECT chat_id, flow, step FROM Dialog_State ORDER BY date_last')
+
+    async def user_city_get(self, user_id: int, limit: int = 10) -> list[dict]:
+        fields_list = ["user_id", "name_en", "name_ru"]
+        fields = ", ".join(fields_list)
+        result = await self.pool.fetch_all(
+            f'SELECT {fields} FROM User_City u JOIN City c ON u.city == c.name_en '
+            f'WHERE user_id == ? ORDER BY date_last DESC LIMIT ?',
+            (user_id, limit),
+        )
+        return [{key: val for key, val in zip(fields_list, city)} for city in result] if result else None
+
+    async def forecast_db_get(self, city: str, fresh_sec: int = PARSED_CONFIG.forecast_cache.store_ttl_sec) -> dict:
+        fresh_since = datetime.datetime.now() - datetime.timedelta(seconds=fresh_sec)
+        fetched_at = (await self.pool.fetch_one(
+            'SELECT MAX(fetched_at) FROM Forecast WHERE city == ? AND fetched_at >= ?', (city, str(fresh_since))
+        ))[0]
+        if fetched_at is None:
+            return None
+        fields = ",".join(self.forecast_field)
+        result = await self.pool.fetch_all(
+            f'SELECT {fields} FROM Forecast WHERE city == ? AND fetched_at == ? ORDER BY row_num', (city, fetched_at)
+        )
+        return {"fetched_at": fetched_at, "result_df": forecast_frame(DataFrame(result, columns=list(self.forecast_field.values())))}
+
+    async def forecast_add(self, city: str, result_df: DataFrame, fetched_at: str):
+        fields = list(self.forecast_field)
+        df = result_df[list(self.forecast_field.values())]
+        df = df.assign(**{self.forecast_field["date"]: df[self.forecast_field["date"]].dt.strftime("%Y-%m-%d")})
+        rows = [(city, fetched_at, row_num, *values) for row_num, values in enumerate(df.itertuples(index=False))]
+
+        def _forecast_add(connection: sqlite3.Connection):
+            connection.execute('DELETE FROM Forecast WHERE city == ?', (city,))
+            connection.executemany(
+                f'INSERT INTO Forecast (city, fetched_at, row_num, {", ".join(fields)}) '
+                f'VALUES ({", ".join("?" * (len(fields) + 3))})',
+                rows,
+            )
+
+        await self.pool.transaction(_forecast_add)    # one transaction for the whole forecast
+
+    async def forecast_load(self, city: str) -> dict:
+        """
+            Read-through the Forecast table: fresh parsed forecast from the DB, otherwise from Yandex
+        """
+        saved = await self.forecast_db_get(city)
+        if saved:
+            return {"message": "", "is_error": False, "source": "db", **saved}
+        return await self._forecast_scrape(city)
+
+    async def _forecast_scrape(self, city: str) -> dict:
+        result = await get_yandex_weather(city)
+        if not result["is_error"]:
+            result["fetched_at"] = str(datetime.datetime.now())
+            await self.forecast_add(city, result["result_df"], result["fetched_at"])
+        return result
+
+    async def forecast_refresh(self, city: str) -> dict:
+        """
+            Reload the forecast from Yandex into the DB and the cache (background prefetch)
+        """
+        city = city.lower()
+        result = await self._forecast_scrape(city)
+        if not result["is_error"]:
+            forecast_cache.set(city, result)
+        return result
+
+    async def forecast_get(self, city: str) -> dict:
+        city = city.lower()
+        result = await forecast_cache.get_or_load(
+            city, self.forecast_load, city, is_cacheable=lambda res: not res["is_error"]
+        )
+        logger.debug(f"forecast cache: {forecast_cache.stats()}")
+        return result
+
+    async def weather_get(self, user_id: int, city: str) -> dict:
+        result = await self.forecast_get(city)
+        await self.log_add(user_id, city, result["is_error"], result["message"])
+        if not result["is_error"]:
+            await self.user_city_add_or_update(user_id, city)
+        return result
+
+    async def weather_batch_get(
+        self, user_id: int, cities: list[str], concurrency: int = PARSED_CONFIG.weather_batch.concurrency
+    ) -> dict[str, dict]:
+        """
+            Forecasts of several cities (at most `concurrency` loads at once), in the order of `cities`
+        """
+        limit = asyncio.Semaphore(concurrency)
+
+        async def _weather_get(city: str) -> dict:
+            async with limit:
+                try:
+                    return await self.weather_get(user_id, city)
+                except Exception as err:
+                    return {"is_error": True, "message": str(err)}
+
+        results = await asyncio.gather(*[_weather_get(city) for city in cities])
+        return dict(zip(cities, results))
@@ -0,0 +1,100 @@
+from collections import Counter, deque
+from typing import Awaitable, Callable
+from urllib.parse import urlsplit
+
+from loguru import logger
+
+from app.adapters.base import fetch_page_content, fetch_page_content_by_browser
+from app.settings import PARSED_CONFIG, FetchRouterConfig
+
+
+def is_forecast_page(content: str) -> bool:
+    return "AppForecastDay_container" in content
+
+
+class FetchRouter:
+    """
+    Adaptive choice of the page loader: plain HTTP first, the pooled browser only when
+    the page has no forecast; the city whose HTTP page had no forecast is remembered as "browser",
+    the host is "browser" first only when most of its recent HTTP fetches failed
+    """
+
+    HTTP, BROWSER = "http", "browser"
+
+    def __init__(
+        self,
+        config: FetchRouterConfig = PARSED_CONFIG.fetch_router,
+        validate: Callable[[str], bool] = is_forecast_page,
+    ):
+        self.config = config
+        self.validate = validate
+        self.fetchers: dict[str, Callable[[str], Awaitable[str]]] = {self.HTTP: fetch_page_content}
+        if config.is_browser_enable:
+            self.fetchers[self.BROWSER] = fetch_page_content_by_browser
+        self.preferred: dict[str, str] = {}  # city -> strategy
+        self.host_http: dict[str, deque[bool]] = {}  # host -> results of the recent HTTP fetches
+        self._since_probe = Counter()
+        self.served = Counter()  # strategy -> served pages
+        self.escalated = 0
+
+    def _host_strategy(self, host: str) -> str:
+        results = self.host_http.get(host)
+        if results is None or len(results) < self.config.host_min_samples:
+            return self.HTTP
+        failed = results.count(False) / len(results)
+        return self.BROWSER if failed >= self.config.host_browser_share else self.HTTP
+
+    def _strategies(self, city: str, host: str) -> list[str]:
+        key = city or host
+        preferred = self.preferred.get(city) or self._host_strategy(host)
+        if preferred == self.BROWSER and self.BROWSER in self.fetchers:
+            self._since_probe[key] += 1
+            if self._since_probe[key] < self.config.reprobe_every:
+                return [self.BROWSER, self.HTTP]
+            self._since_probe[key] = 0  # time to check whether plain HTTP works again
+        return list(self.fetchers)
+
+    def _http_result(self, host: str, is_ok: bool):
+        self.host_http.setdefault(host, deque(maxlen=self.config.host_window)).append(is_ok)
+
+    async def fetch(self, url: str, city: str = None) -> tuple[str, str]:
+        """(page content, strategy that served it)"""
+        host = urlsplit(url).netloc
+        content, strategy, error = "", None, None
+        is_http_invalid = False  # the HTTP page is loaded, but has no forecast (rendered by the browser only)
+        for number, strategy in enumerate(self._strategies(city, host)):
+            if number and strategy == self.BROWSER:
+                self.escalated += 1
+            try:
+                content = await self.fetchers[strategy](url)
+            except Exception as err:
+                logger.info(f"{strategy} fetch `{url}`: {err}")
+                error = err
+                if strategy == self.HTTP:
+                    self._http_result(host, False)
+                continue
+            is_valid = self.validate(content)
+            if strategy == self.HTTP:
+                self._http_result(host, is_valid)
+                is_http_invalid = not is_valid
+            if is_valid:
+                if city and (strategy == self.HTTP or is_http_invalid):
+                    # a failure of HTTP (timeout, error) does not make the city "browser"
+                    self.preferred[city] = strategy
+                self.served[strategy] += 1
+                logger.info(f"`{url}` is served by {strategy}")
+                return content, strategy
+        if error is not None and not content:
+            raise error
+        return content, strategy
+
+    def stats(self) -> dict:
+        return {
+            "served": dict(self.served),
+            "escalated": self.escalated,
+            "browser_cities": sum(strategy == self.BROWSER for strategy in self.preferred.values()),
+            "browser_hosts": [host for host in self.host_http if self._host_strategy(host) == self.BROWSER],
+        }
+
+
+fetch_router = FetchRouter()
@@ -0,0 +1,106 @@
+import asyncio
+import itertools
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterable
+
+from loguru import logger
+
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA temp_store=MEMORY",
+)
+
+
+class _Worker:
+    """
+    Long-lived SQLite connection owned by its own thread
+    """
+
+    def __init__(self, path: str, name: str):
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=name)
+        self.connection: sqlite3.Connection = self.executor.submit(self._connect, path).result()
+
+    @staticmethod
+    def _connect(path: str) -> sqlite3.Connection:
+        # SQL texts are constants, so `cached_statements` keeps them prepared between calls
+        connection = sqlite3.connect(path, cached_statements=256)
+        for pragma in PRAGMAS:
+            connection.execute(pragma)
+        return connection
+
+    async def call(self, fn: Callable[[sqlite3.Connection], Any]) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fn, self.connection)
+
+    def close(self):
+        self.executor.submit(self.connection.close).result()
+        self.executor.shutdown()
+
+
+class AsyncSQLitePool:
+    """
+    Asynchronous access to SQLite (WAL mode):
+    one writer connection plus several reader connections, every one in its own thread
+    """
+
+    def __init__(self, path: str, readers: int = 4):
+        self.path = path
+        self.readers_count = readers
+        self._writer: _Worker | None = None
+        self._readers: list[_Worker] = []
+        self._next_reader = None
+
+    def open(self):
+        if self._writer is not None:
+            return
+        self._writer = _Worker(self.path, "sqlite-writer")
+        self._readers = [_Worker(self.path, f"sqlite-reader-{num}") for num in range(self.readers_count)]
+        self._next_reader = itertools.cycle(self._readers)
+        logger.info(f"SQLite pool opened: {self.path} (readers={self.readers_count})")
+
+    def close(self):
+        for worker in [self._writer, *self._readers]:
+            if worker is not None:
+                worker.close()
+        self._writer, self._readers, self._next_reader = None, [], None
+
+    def _reader(self) -> _Worker:
+        self.open()
+        return next(self._next_reader)
+
+    def _writer_worker(self) -> _Worker:
+        self.open()
+        return self._writer
+
+    async def fetch_one(self, sql: str, params: Iterable = ()) -> tuple | None:
+        return await self._reader().call(lambda connection: connection.execute(sql, params).fetchone())
+
+    async def fetch_all(self, sql: str, params: Iterable = ()) -> list[tuple]:
+        return await self._reader().call(lambda connection: connection.execute(sql, params).fetchall())
+
+    async def execute(self, sql: str, params: Iterable = ()) -> int:
+        def _execute(connection: sqlite3.Connection) -> int:
+            with connection:
+                return connection.execute(sql, params).lastrowid
+
+        return await self._writer_worker().call(_execute)
+
+    async def execute_many(self, sql: str, seq_of_params: Iterable[Iterable]):
+        def _execute_many(connection: sqlite3.Connection):
+            with connection:
+                connection.executemany(sql, seq_of_params)
+
+        await self._writer_worker().call(_execute_many)
+
+    async def transaction(self, fn: Callable[[sqlite3.Connection], Any]) -> Any:
+        """
+        Run `fn(connection)` on the writer connection inside one transaction
+        """
+
+        def _transaction(connection: sqlite3.Connection):
+            with connection:
+                return fn(connection)
+
+        return await self._writer_worker().call(_transaction)
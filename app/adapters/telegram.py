@@ -1,11 +1,18 @@
 import asyncio
 import collections
+import contextlib
+import functools
+import hashlib
+import signal
 import time
 
 from aiogram import Bot, Dispatcher, types
 from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.filters import Command
+from aiogram.utils.backoff import Backoff, BackoffConfig
 from aiogram.types import (
+    BufferedInputFile,
     ReplyKeyboardMarkup,
     InlineKeyboardButton,
     InlineKeyboardMarkup,
@@ -14,7 +21,13 @@ from aiogram.types import (
 from loguru import logger
 
 from app.services.dialog_flow import CommandToBack, DialogFlow, HTML, Message, Photo, CommandToTelegram, File
-from app.utils.utils import run_async
+from app.services.dialog_state import DialogStateStore
+from app.services.job_queue import DONE, Job, JobQueue
+from app.services.outbound import INTERACTIVE, OutboundDispatcher
+from app.settings import MediaCacheConfig, PollingConfig, RateLimit, WebhookConfig
+from app.utils.cache import AsyncTTLCache
+from app.utils.debouncer import Debouncer
+from app.utils.utils import read_static
 
 
 class TelegramService:
@@ -22,20 +35,41 @@ class TelegramService:
     Class for working with Telegram
     """
 
-    def __init__(self, token: str, proxy: str, dialog_flow: DialogFlow, generator=None):
+    def __init__(self, token: str, proxy: str, dialog_flow: DialogFlow, generator=None,
+                 dialog_state: DialogStateStore = None, message_window: float = 1.0, message_max_wait: float = 3.0,
+                 polling: PollingConfig = None, webhook: WebhookConfig = None, rate_limit: RateLimit = None,
+                 media_cache: MediaCacheConfig = None, layout_cache_size: int = 1024, job_queue: JobQueue = None):
         self.dialog_flow = dialog_flow
+        self.jobs = job_queue
         self.generator = generator
+        self.polling = polling or PollingConfig()
+        self.webhook = webhook or WebhookConfig()
+        self.health = {
+            "mode": "webhook" if self.webhook.is_enable else "polling",
+            "state": "stopped",  # stopped | running | backoff
+            "since": time.time(),
+            "restarts": 0,
+            "last_error": None,
+            "retry_in": None,
+        }
 
         self.session = AiohttpSession(proxy=proxy) if proxy else AiohttpSession()
         self.bot = Bot(token=token, session=self.session)
+        # all the messages to the chats go through the queue: per chat order, rate limits, "retry after"
+        self.outbound = OutboundDispatcher(rate_limit)
+        media_cache = media_cache or MediaCacheConfig()
+        # (photo | document, content hash, file name) -> file_id of the uploaded file
+        self.media_cache = AsyncTTLCache(ttl=media_cache.ttl_sec, max_size=media_cache.max_size)
+        # (button texts, menu_scale) -> lengths of the keyboard rows
+        self._row_sizes = functools.lru_cache(maxsize=layout_cache_size)(self._row_sizes_compute)
 
         self.dispatcher = Dispatcher()
         # self.dispatcher = Dispatcher(self.bot)
         self._set_handlers_for_dispatcher()
-        self.combined_messages = {}
-        self.handlers = collections.defaultdict(
-            self.generator
-        )  # заводим мапу "id чата -> генератор"
+        # the messages of a user sent within `message_window` are handled as one text
+        self.debouncer = Debouncer(self._process_text, window=message_window, max_wait=message_max_wait)
+        # "id чата -> генератор" (bounded, the idle chats are evicted)
+        self.handlers = dialog_state if dialog_state is not None else DialogStateStore()
 
     def _set_handlers_for_dispatcher(self):
         """
@@ -47,26 +81,72 @@ class TelegramService:
         self.dispatcher.message.register(self.process_messages)
         self.dispatcher.callback_query.register(self.callback_inline)
 
+    def _set_health(self, state: str, **kwargs):
+        self.health.update(state=state, since=time.time(), **kwargs)
+
     async def start_listener(self):
         """
-        Start listening to messages from Telegram
+        Start listening to messages from Telegram: the webhook server or the supervised long polling
+        """
+        if self.webhook.is_enable:
+            await self.start_webhook()
+        else:
+            await self.start_polling()
+
+    async def start_polling(self):
         """
+        The polling is restarted after a failure with exponential backoff (asyncio - the other tasks keep working)
+        """
+        backoff = Backoff(BackoffConfig(
+            min_delay=self.polling.backoff_min_sec,
+            max_delay=self.polling.backoff_max_sec,
+            factor=self.polling.backoff_factor,
+            jitter=self.polling.backoff_jitter,
+        ))
         while True:
+            started = time.monotonic()
+            self._set_health("running", retry_in=None)
             try:
                 await self.dispatcher.start_polling(self.bot)
+                self._set_health("stopped")
+                self._signal_handlers_remove()
+                return  # `stop_polling()`
             except Exception as e:
-                logger.error({str(e)})
-                time.sleep(5)
+                if time.monotonic() - started >= self.polling.stable_sec:
+                    backoff.reset()
+                delay = max(next(backoff), 0)
+                self.health["restarts"] += 1
+                self._set_health("backoff", last_error=str(e), retry_in=round(delay, 1))
+                logger.error(f"polling failed: {e}; restart in {delay:.1f} sec (attempt {backoff.counter})")
+                await asyncio.sleep(delay)
 
-    async def send_message(self, *args, **kwargs):
-        await self.bot.send_message(*args, **kwargs)
+    @staticmethod
+    def _signal_handlers_remove():
+        # aiogram leaves its SIGINT / SIGTERM handlers installed: a signal during the shutdown would be swallowed
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            with contextlib.suppress(NotImplementedError):
+                loop.remove_signal_handler(sig)
 
-    async def start_handler(self, message: types.Message):
+    async def start_webhook(self):
+        import uvicorn  # optional dependency (extra "webhook")
+
+        from app.adapters.webhook import create_webhook_app
+
+        server = uvicorn.Server(uvicorn.Config(
+            create_webhook_app(self, self.webhook), host=self.webhook.host, port=self.webhook.port, log_config=None,
+        ))
+        self._set_health("running", retry_in=None)
         try:
-            with open("app/static/logo.png", "rb") as in_file:  # opening for [r]eading as [b]inary
-                logo = in_file.read()
-        except:
-            logo = None
+            await server.serve()
+        finally:
+            self._set_health("stopped")
+
+    async def send_message(self, chat_id, text, priority: int = INTERACTIVE, **kwargs):
+        return await self.outbound.send(chat_id, self.bot.send_message, priority, text=text, **kwargs)
+
+    async def start_handler(self, message: types.Message):
+        logo = read_static("app/static/logo.png")
         # await self.bot.send_message(message.chat.id, "Бот запущен")
         username = message.chat.first_name
         await self.send_answer(
@@ -83,41 +163,32 @@ class TelegramService:
         )
 
     async def end_handler(self, message: types.Message):
-        await self.bot.send_message(message.chat.id, "Бот остановлен")
+        await self.send_message(message.chat.id, "Бот остановлен")
 
     async def process_messages(self, message: types.Message):
         """
-        Telegram message processing function
+        Telegram message processing function: the text is joined with the next messages of the user (debouncer),
+        the commands are handled at once
         """
-        chat_id = message.chat.id
-        user_id = message.from_user.id
-
-        if user_id in self.combined_messages:
-            self.combined_messages[user_id] += f"\n{message.text}"
-        else:
-            self.combined_messages[user_id] = message.text
-        await asyncio.sleep(1)
+        if not message.text or (message.forward_from_chat is not None and message.forward_from_chat.type == "channel"):
+            return
+        window = 0 if message.text.startswith("/") or self.dialog_flow.is_command_dialog_flow(message.text) else None
+        self.debouncer.push(message.from_user.id, message.text, message, window=window)
 
-        if self.combined_messages.get(user_id) and (
-            message.forward_from_chat is None
-            or message.forward_from_chat.type != "channel"
-        ):
+    async def _process_text(self, user_id: int, mes: str, message: types.Message):
+        chat_id = message.chat.id
+        if mes:
             try:
-                mes = self.combined_messages[user_id]
-                del self.combined_messages[user_id]
-                logger.info("Received", mes)
+                logger.info(f"Received {mes}")
                 if mes == "/start":
                     # если передана команда /start, начинаем всё с начала -- для
                     # этого удаляем состояние текущего чатика, если оно есть
                     self.handlers.pop(chat_id, None)
 
-                if chat_id not in self.handlers:  # начало общения
-                    # self.handlers[chat_id] = flow_default()  # значит, запустим default DialogFlow
-                    self.handlers[chat_id] = None  # значит, запустим default DialogFlow
-
+                generator = await self._dialog_generator(chat_id, message.from_user.first_name)
                 # в получаемом кортеже может смениться активный DialogFlow (команды)
-                answer, self.handlers[chat_id] = self.dialog_flow.dialog_flow(
-                    function_or_generator=self.handlers[chat_id],
+                answer, self.handlers[chat_id] = await self.dialog_flow.dialog_flow(
+                    function_or_generator=generator,
                     chat_id=chat_id,
                     username=message.from_user.first_name,
                     text=mes,
@@ -127,62 +198,91 @@ class TelegramService:
                 await self.send_answer(chat_id, answer)
                 # await self.bot.send_message(chat_id, f"Задача на получение информации создана\n{answer}")
                 logger.info(f"через БОТ в чат {chat_id} направлен ответ: {answer}")
+                logger.debug(f"debounce: {self.debouncer.stats()}")
 
             except KeyError as e:
                 logger.error(str(e))
+            except Exception as e:
+                # the dialog of the chat is broken - it starts with the default flow next time
+                self.handlers.pop(chat_id, None)
+                logger.error(f"chat {chat_id}: {e}")
 
-    async def send_answer(self, chat_id, answer):
+    async def _dialog_generator(self, chat_id: int, username: str = None):
+        """
+        Live generator of the chat or the flow resumed from the evicted / saved point (None - default flow)
+        """
+        generator = self.handlers.get(chat_id)
+        if generator is not None:
+            return generator
+        point = self.handlers.pop_resume_point(chat_id)
+        if point is not None:
+            try:
+                generator = await self.dialog_flow.resume_flow(*point, chat_id=chat_id, username=username)
+                self.handlers[chat_id] = generator  # the first step is passed again
+                return generator
+            except Exception as e:
+                logger.error(f"chat {chat_id}: the flow {point} is not resumed: {e}")
+        return None
+
+    async def dialog_state_load(self):
+        self.handlers.restore(await self.dialog_flow.weather_parser.dialog_state_get())
+        logger.info(f"dialog state: {self.handlers.stats()}")
+
+    async def dialog_state_save(self):
+        await self.dialog_flow.weather_parser.dialog_state_save(self.handlers.snapshot())
+
+    async def send_answer(self, chat_id, answer, priority: int = INTERACTIVE):
         # logger.info("Sending answer %r to %s" % (answer, chat_id))
         if answer == "":  # Google не всегда отвечает
             return
+        menu_scale = await self._get_menu_scale(chat_id)
         if isinstance(answer, collections.abc.Iterable) and not isinstance(answer, str):
             # мы получили несколько объектов -- сперва каждый надо обработать
-            answer = [self._convert_answer_part(el, chat_id) for el in answer]
+            answer = [self._convert_answer_part(el, menu_scale) for el in answer]
         else:
             # мы получили один объект -- сводим к более общей задаче
-            answer = [self._convert_answer_part(answer, chat_id)]
+            answer = [self._convert_answer_part(answer, menu_scale)]
 
         # перед тем, как отправить очередное сообщение, идём вперёд в поисках
         # «довесков» -- клавиатуры там или в перспективе ещё чего-нибудь
         current_message = None
         command = None
+        back_commands = []
         for part in answer:
             if isinstance(part, CommandToBack):
                 # for sending to KAFKA
                 # message = MessageScheme(user_id=chat_id, command=part.command, content=part.content)
                 # await self.kafka.send_message(dict(message), partition_key=b"to_back")
                 # print(f"Send to KAFKA {dict(message)}")
-                logger.info(f"в KAFKA отпралено сообщение: {part}")
+                if self.jobs is not None:
+                    back_commands.append(part)  # after the messages of the answer
+                else:
+                    logger.info(f"в KAFKA отпралено сообщение: {part}")
             if isinstance(part, CommandToTelegram):
                 # for sending to Telegram
                 command = part
             if isinstance(part, Photo):
                 if part.image:
                     if current_message is not None:
-                        await self.bot.send_message(
-                            chat_id=chat_id,
-                            text=current_message.text,
-                            **current_message.options,
-                        )
+                        await self.send_message(chat_id, current_message.text, priority, **current_message.options)
                         current_message = None
-                    await self.bot.send_photo(chat_id=chat_id, photo=part.image)
+                    await self.send_media(chat_id, "photo", part.image, priority)
                 # part = Message(part.text)
             if isinstance(part, File):
                 if part.file:
                     if current_message is not None:
-                        await self.bot.send_message(
-                            chat_id=chat_id,
-                            text=current_message.text,
-                            **current_message.options,
-                        )
+                        await self.send_message(chat_id, current_message.text, priority, **current_message.options)
                         current_message = None
-                    await self.bot.send_document(chat_id=chat_id, document=part.file)
+                    await self.send_media(chat_id, "document", part.file, priority)
                 # part = Message(part.text)
             if isinstance(part, Message):
-                if current_message is not None:
+                if current_message is not None and self._is_joinable(current_message, part):
+                    # the texts in a row are sent as one message
+                    part = Message(f"{current_message.text}\n{part.text}", **current_message.options)
+                elif current_message is not None:
                     options = dict(current_message.options)
                     options.setdefault("disable_notification", True)
-                    self.bot.message.reply_text(text=current_message.text, **options)
+                    await self.send_message(chat_id, current_message.text, priority, **options)
                 current_message = part
             if isinstance(part, ReplyKeyboardMarkup | InlineKeyboardMarkup):
                 if current_message is None:
@@ -190,18 +290,97 @@ class TelegramService:
                 current_message.options["reply_markup"] = part
 
         if current_message is not None:
-            await self.bot.send_message(
-                chat_id=chat_id, text=current_message.text, **current_message.options
-            )
+            await self.send_message(chat_id, current_message.text, priority, **current_message.options)
+        for back_command in back_commands:
+            await self.submit_job(chat_id, back_command, priority)
         if command:
-            answer_add, self.handlers[chat_id] = self.dialog_flow.dialog_flow(
+            answer_add, self.handlers[chat_id] = await self.dialog_flow.dialog_flow(
                 # function_or_generator=self.handlers[chat_id],
                 chat_id=chat_id,
                 text=command.command,
             )
-            await self.send_answer(chat_id=chat_id, answer=answer_add)
+            await self.send_answer(chat_id=chat_id, answer=answer_add, priority=priority)
+
+    async def submit_job(self, chat_id, command: CommandToBack, priority: int = INTERACTIVE):
+        """
+        The command is done by the job queue: the status message of the job is edited by its progress,
+        the answer of the job is sent by `send_answer`
+        """
+        status, status_text, edited = None, None, 0.0
+        edits = set()  # the progress edits sent in background
+
+        async def _edit(job: Job, text: str):
+            if job.finished is not None and text != job.describe():  # the end of the job is already shown
+                return
+            try:
+                await self.outbound.send(chat_id, self.bot.edit_message_text, priority,
+                                         message_id=status.message_id, text=text)
+            except Exception as e:
+                logger.warning(f"chat {chat_id}: status of the job {job.id} is not edited: {e}")
 
-    def _convert_answer_part(self, answer_part, user_id: int):
+        async def _progress(job: Job):
+            nonlocal status_text, edited
+            text = job.describe()
+            # Telegram rejects the edit without changes; the edits take the rate limit of the chat -
+            # the progress is shown at most once a second and the job does not wait for it
+            if status is None or text == status_text or time.monotonic() - edited < 1:
+                return
+            status_text, edited = text, time.monotonic()
+            edit = asyncio.create_task(_edit(job, text))
+            edits.add(edit)
+            edit.add_done_callback(edits.discard)
+
+        async def _done(job: Job):
+            if status is not None and job.describe() != status_text:
+                await _edit(job, job.describe())
+            if job.status == DONE:
+                await self.send_answer(chat_id, job.result, priority)
+            else:
+                await self.send_answer(chat_id, (HTML("Не удалось подготовить ответ, попробуйте позже"),
+                                                 self.dialog_flow.button_default), priority)
+
+        title = self.dialog_flow.back_commands[command.command][1]
+        job = self.jobs.submit(
+            self.dialog_flow.back_command, command.command, command.chat_id, command.content,
+            chat_id=chat_id, title=f"{title} {command.content or ''}".strip(),
+            on_progress=_progress, on_done=_done,
+        )
+        if job is None:
+            await self.send_message(chat_id, "Очередь задач переполнена, попробуйте позже", priority)
+            return
+        status_text = job.describe()
+        status = await self.send_message(chat_id, status_text, priority)
+        edited = time.monotonic()
+        if job.finished is not None:  # the job is done while the status was sent
+            await _edit(job, job.describe())
+
+    async def send_media(self, chat_id, kind: str, media: BufferedInputFile, priority: int = INTERACTIVE):
+        """
+        Photo / document: the same content is sent by the file_id of the first upload
+        """
+        method = self.bot.send_photo if kind == "photo" else self.bot.send_document
+        key = (kind, hashlib.sha256(media.data).hexdigest(), media.filename if kind == "document" else None)
+        file_id = self.media_cache.get(key)
+        if file_id is not None:
+            try:
+                return await self.outbound.send(chat_id, method, priority, **{kind: file_id})
+            except TelegramBadRequest as e:  # the file_id is not valid any more
+                logger.warning(f"cached {kind} is not sent: {e}")
+                self.media_cache.invalidate(key)
+        result = await self.outbound.send(chat_id, method, priority, **{kind: media})
+        sent = result.photo[-1] if kind == "photo" else result.document  # the largest size of the photo
+        self.media_cache.set(key, sent.file_id)
+        return result
+
+    @staticmethod
+    def _is_joinable(message: Message, next_message: Message) -> bool:
+        return (
+            "reply_markup" not in message.options
+            and message.options == next_message.options
+            and len(message.text) + len(next_message.text) < 4096  # max length of the Telegram message
+        )
+
+    def _convert_answer_part(self, answer_part, menu_scale: int = 0):
         buttons_per_row = 2
         if not answer_part or answer_part == []:
             return None
@@ -217,7 +396,7 @@ class TelegramService:
                 # For InLine Buttons with CallBack
                 buttons = [InlineKeyboardButton(text=self.dialog_flow.add_img_in_command(el), callback_data=el) for el
                            in answer_part]
-                buttons = self._buttons_in_rows(buttons, user_id)    # forced into one line
+                buttons = self._buttons_in_rows(buttons, menu_scale)    # forced into one line
                 # buttons = [buttons[i:i + buttons_per_row] for i in range(0, len(buttons), buttons_per_row)]
                 return InlineKeyboardMarkup(inline_keyboard=buttons, row_width=buttons_per_row)
             if isinstance(answer_part[0], list):  # кнопки с подписями из локального DialogFlow
@@ -231,7 +410,7 @@ class TelegramService:
                             InlineKeyboardButton(text=self.dialog_flow.add_img_in_command(el[0]), callback_data=el[1]))
                 # buttons = [InlineKeyboardButton(text=self.dialog_flow.add_img_in_command(el[0]), callback_data=el[1])
                 #            for el in answer_part]
-                buttons = self._buttons_in_rows(buttons, user_id)    # forced into one line
+                buttons = self._buttons_in_rows(buttons, menu_scale)    # forced into one line
                 # buttons = [buttons[i:i + buttons_per_row] for i in range(0, len(buttons), buttons_per_row)]
                 return InlineKeyboardMarkup(inline_keyboard=buttons, row_width=2)
             elif isinstance(answer_part[0], dict):  # кнопки от Google DialogFlow
@@ -252,27 +431,38 @@ class TelegramService:
                     return ReplyKeyboardMarkup(map(list, answer_part), one_time_keyboard=True, resize_keyboard=True)
         return answer_part
 
-    def _buttons_in_rows(self, buttons: list, user_id: int):
+    async def _get_menu_scale(self, user_id: int) -> int:
+        try:
+            prefs = await self.dialog_flow.weather_parser.user_prefs_get(user_id)
+            return prefs["menu_scale"] or 0
+        except Exception as e:
+            logger.error(f"chat {user_id}: menu_scale is not read: {e}")
+            return 0
+
+    def _buttons_in_rows(self, buttons: list, menu_scale: int = 0):
         result = []
-        current_row = []
+        start = 0
+        for size in self._row_sizes(tuple(button.text for button in buttons), menu_scale):
+            result.append(buttons[start:start + size])
+            start += size
+        return result
+
+    def _row_sizes_compute(self, texts: tuple, menu_scale: int = 0) -> tuple:
+        result = []
+        current_row = 0
         current_len = 0
-        try:
-            user = run_async(self.dialog_flow.weather_parser.user_get, self.dialog_flow.weather_parser, user_id)
-            menu_scale = (user.menu_scale or 0)
-        except:
-            menu_scale = 0
-        for count in range(len(buttons)):
-            button_len = len(buttons[count].text) + 2
+        for text in texts:
+            button_len = len(text) + 2
             if current_len and current_len + button_len > 34 - menu_scale * 5 \
-                    or self.dialog_flow.get_command_from_str(buttons[count].text.lower())[0] in self.dialog_flow.command_exit:
+                    or self.dialog_flow.get_command_from_str(text.lower())[0] in self.dialog_flow.command_exit:
                 result.append(current_row)
-                current_row = []
+                current_row = 0
                 current_len = 0
-            current_row.append(buttons[count])
+            current_row += 1
             current_len += button_len
         if current_row:
             result.append(current_row)
-        return result
+        return tuple(result)
 
     async def callback_inline(self, call: CallbackQuery):
         if not call.data:
@@ -286,20 +476,16 @@ class TelegramService:
                 # если передана команда /start, начинаем всё с начала -- для
                 # этого удаляем состояние текущего чатика, если оно есть
                 self.handlers.pop(chat_id, None)
-            command_startswith = command.split(" ")[0]
-            if command_startswith in list(self.dialog_flow.command_dict):
-                try:
-                    param = command.split(" ")[1]
-                except:
-                    param = None
+            command_startswith, _, param_str = command.partition(" ")
+            if command_startswith in self.dialog_flow.command_dict:
+                # the param is the rest of the data: the names of the cities may have spaces
+                param = param_str.strip() or None
                 command = command_startswith
 
-            if chat_id not in self.handlers:  # начало общения
-                self.handlers[chat_id] = None  # значит, запустим default DialogFlow
-
+            generator = await self._dialog_generator(chat_id, call.from_user.first_name)
             # в получаемом кортеже может смениться активный DialogFlow (команды)
-            answer, self.handlers[chat_id] = self.dialog_flow.dialog_flow(
-                function_or_generator=self.handlers[chat_id],
+            answer, self.handlers[chat_id] = await self.dialog_flow.dialog_flow(
+                function_or_generator=generator,
                 chat_id=chat_id,
                 username=call.from_user.first_name,
                 text=command,
@@ -314,5 +500,10 @@ class TelegramService:
             logger.error(str(e))
 
     async def close(self):
-        await self.dispatcher.stop_polling()
+        self.debouncer.cancel()
+        if self.jobs is not None:
+            await self.jobs.close()
+        await self.outbound.close()
+        if self.health["mode"] == "polling" and self.health["state"] == "running":
+            await self.dispatcher.stop_polling()
         await self.session.close()
@@ -0,0 +1,50 @@
+from contextlib import asynccontextmanager
+
+from aiogram import types
+from fastapi import FastAPI, Request, Response
+from loguru import logger
+
+from app.services.update_queue import ShardedUpdateQueue
+from app.settings import WebhookConfig
+
+
+def create_webhook_app(telegram, config: WebhookConfig) -> FastAPI:
+    """
+    FastAPI application receiving the Telegram updates (webhook) for the `TelegramService`:
+    the update is answered at once and processed by the sharded worker queue;
+    the webhook is set on startup and deleted on shutdown; GET /health - the state of the bot and the queue
+    """
+    updates = ShardedUpdateQueue(
+        lambda update: telegram.dispatcher.feed_update(telegram.bot, update),
+        workers=config.workers, max_size=config.queue_size,
+    )
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        updates.start()
+        if config.url:
+            await telegram.bot.set_webhook(
+                f"{config.url.rstrip('/')}{config.path}", secret_token=config.secret_token or None,
+                drop_pending_updates=False,
+            )
+            logger.info(f"webhook is set: {config.url.rstrip('/')}{config.path}")
+        yield
+        if config.url:
+            await telegram.bot.delete_webhook()
+        await updates.stop()
+
+    app = FastAPI(title="Yandex Weather Bot webhook", lifespan=lifespan)
+    app.state.updates = updates
+
+    @app.post(config.path)
+    async def telegram_update(request: Request) -> Response:
+        if config.secret_token and request.headers.get("X-Telegram-Bot-Api-Secret-Token") != config.secret_token:
+            return Response(status_code=403)
+        update = types.Update.model_validate(await request.json(), context={"bot": telegram.bot})
+        return Response(status_code=200 if updates.put(update) else 503)
+
+    @app.get("/health")
+    async def health() -> dict:
+        return {**telegram.health, "updates": updates.stats()}
+
+    return app
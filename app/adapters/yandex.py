@@ -1,85 +1,218 @@
+import datetime
 import re
 
 import pandas as pd
-from bs4 import BeautifulSoup
+from lxml import etree, html
 
 from pandas import DataFrame
 
-from app.adapters.base import get_page_content
-from app.utils.utils import clean_html
+from app.adapters.fetch_router import fetch_router
+from app.utils.executor import cpu_executor
+from app.utils.utils import TYPED_ATTR, clean_html
 
+FORECAST_COLUMNS = [
+    "Дата",
+    "Время суток",
+    "Температура",
+    "Средняя температура за световой день",
+    "Давление",
+    "Давление (комментарий)",
+    "Влажность",
+    "Погодное явление",
+    "Магнитное поле",
+]
+# arrow types of the forecast columns (`ForecastColumns.to_arrow`)
+FORECAST_ARROW_TYPES = dict(zip(FORECAST_COLUMNS, [
+    "timestamp[ns]", "string", "int64", "double", "int64", "string", "string", "string", "string",
+]))
+PART_DAY_ORDER = ["утро", "день", "вечер", "ночь"]
+MONTHS = {
+    month: number for number, month in enumerate(
+        ["января", "февраля", "марта", "апреля", "мая", "июня",
+         "июля", "августа", "сентября", "октября", "ноября", "декабря"], start=1)
+}
+DAY_MONTH_PATTERN = re.compile(r"(\d{1,2})\s+([а-я]+)", re.I)
 
-async def get_yandex_weather(city: str) -> dict:
-    try:
-        page_address = f"https://yandex.ru/pogoda/ru/{city}"
-        content = get_page_content(page_address)
-        soup = BeautifulSoup(content, "html.parser")
-        # forecasts = soup.find_all(class_="AppForecastDay_container__AnH4J")
-        forecasts = soup.find_all(class_=re.compile("AppForecastDay_container", re.I))
-    except Exception as err:
-        return {"is_error": True, "message": err}
-        # return {"status": MyLogTypeEnum.ERROR, "message": err}
+# day blocks of the forecast (one XPath pass over the document, in C)
+FORECAST_DAYS = etree.XPath(
+    '//*[re:test(@class, "AppForecastDay_container", "i")]',
+    namespaces={"re": "http://exslt.org/regular-expressions"},
+)
+# fields of the day block: name -> (attribute, pattern)
+FORECAST_FIELDS = {
+    "day_title": ("class", re.compile("AppForecastDayHeader_dayTitle", re.I)),
+    "duration": ("class", re.compile("AppForecastDayDuration_item", re.I)),
+    "part_day": ("style", re.compile("-part", re.I)),
+    "temperature": ("class", re.compile("AppForecastDayPart_temp", re.I)),
+    "pressure": ("style", re.compile("-press", re.I)),
+    "wetness": ("style", re.compile("-hum", re.I)),
+    "event": ("style", re.compile("-text", re.I)),
+}
+
+
+def forecast_summary(forecasts: dict[str, dict]) -> DataFrame:
+    """One row per city of `{city: get_yandex_weather() result}`: temperature range over the forecast or the error"""
+    rows = []
+    for city, result in forecasts.items():
+        df = result.get("result_df")
+        is_data = not result["is_error"] and df is not None and not df.empty
+        rows.append({
+            "Город": city,
+            "Дней": df["Дата"].nunique() if is_data else 0,
+            "Мин. температура": df["Температура"].min() if is_data else None,
+            "Макс. температура": df["Температура"].max() if is_data else None,
+            "Средняя температура": round(df["Средняя температура за световой день"].mean(), 1) if is_data else None,
+            "Ошибка": "" if is_data else (result.get("message") or "").strip(),
+        })
+    return DataFrame(rows)
+
+
+def parse_day_date(title: str, index: int, today: datetime.date = None) -> datetime.date:
+    """'18 октября' -> date (the year is taken from `today`); without a date in the title - `today` + `index` days"""
+    today = today or datetime.date.today()
+    match = DAY_MONTH_PATTERN.search(title)
+    if match and match.group(2).lower() in MONTHS:
+        day, month = int(match.group(1)), MONTHS[match.group(2).lower()]
+        year = today.year + (1 if month < today.month - 6 else 0)  # December -> January
+        return datetime.date(year, month, day)
+    return today + datetime.timedelta(days=index)
+
+
+def forecast_frame(data: dict[str, list] | DataFrame) -> DataFrame:
+    """Forecast DataFrame with the column types: date, categorical part of the day, int temperature / pressure"""
+    df = DataFrame(data, columns=FORECAST_COLUMNS)
+    parts = PART_DAY_ORDER + sorted(set(df["Время суток"].dropna()) - set(PART_DAY_ORDER))
+    df = df.astype({
+        "Время суток": pd.CategoricalDtype(parts, ordered=True),
+        "Температура": "int64",
+        "Средняя температура за световой день": "float64",
+        "Давление": "int64",
+    }).assign(**{"Дата": pd.to_datetime(df["Дата"], errors="coerce", format="ISO8601")})
+    df.attrs[TYPED_ATTR] = True  # the xlsx writer does not look for the numbers in the texts
+    return df
+
+
+class ForecastColumns:
+    """
+    Columnar accumulator of the forecast rows: one typed DataFrame at the end instead of `pd.concat` per day
+    """
+
+    def __init__(self):
+        self.data: dict[str, list] = {column: [] for column in FORECAST_COLUMNS}
+
+    def __len__(self) -> int:
+        return len(self.data["Время суток"])
+
+    def add_day(self, date: datetime.date, part_day: list, temperature: list, temperature_avg: float,
+                pressure: list, pressure_text: str, wetness: list, event: list, magnetic_field: str):
+        rows = len(part_day)
+        if any(len(values) != rows for values in (temperature, pressure, wetness, event)):
+            raise ValueError("All arrays must be of the same length")
+        for column, values in zip(FORECAST_COLUMNS, (
+            [date] * rows, part_day, temperature, [temperature_avg] * rows,
+            pressure, [pressure_text] * rows, wetness, event, [magnetic_field] * rows,
+        )):
+            self.data[column].extend(values)
+
+    def to_frame(self) -> DataFrame:
+        return forecast_frame(self.data)
+
+    def to_records(self) -> list[dict]:
+        return [dict(zip(self.data, row)) for row in zip(*self.data.values())]
+
+    def to_arrow(self):
+        import pyarrow  # optional dependency
+
+        schema = pyarrow.schema([(column, pyarrow.type_for_alias(type_)) for column, type_ in FORECAST_ARROW_TYPES.items()])
+        return pyarrow.Table.from_pandas(self.to_frame(), schema=schema, preserve_index=False)
+
+
+def _contents(element) -> list:
+    """Child nodes of the element (texts and tags) - the same as `Tag.contents` of BeautifulSoup"""
+    result = [element.text] if element.text is not None else []
+    for child in element:
+        if isinstance(child.tag, str):
+            result.append(child)
+        if child.tail is not None:
+            result.append(child.tail)
+    return result
+
+
+def _text(node) -> str:
+    return node if isinstance(node, str) else node.text_content()
+
+
+def _day_fields(forecast) -> dict[str, list]:
+    """One walk over the day block, every element is checked against all the field patterns"""
+    fields = {name: [] for name in FORECAST_FIELDS}
+    for element in forecast.iterdescendants(tag=etree.Element):
+        for name, (attribute, pattern) in FORECAST_FIELDS.items():
+            value = element.get(attribute)
+            if value and pattern.search(value):
+                fields[name].append(element)
+    return fields
+
+
+def parse_forecast_page(content: str, page_address: str = "", output: str = "frame") -> tuple:
+    """
+    Forecast for 7 days from the page: (result, error message);
+    `output` - type of the result: "frame" (DataFrame), "records" (list of dict) or "arrow" (pyarrow.Table)
+    """
+    forecasts = FORECAST_DAYS(html.document_fromstring(content)) if content.strip() else []
 
     error_msg = ""
-    result_df = DataFrame()
-    for  index, forecast in enumerate(forecasts):
-        if index >= 7: # only 7 days
+    columns = ForecastColumns()
+    today = datetime.date.today()
+    for index, forecast in enumerate(forecasts):
+        if index >= 7:  # only 7 days
             break
         try:
-            date_day = forecast.attrs["data-day"][forecast.attrs["data-day"].rfind("_")+1:]
-            # date_day_month = forecast.find(class_="AppForecastDayHeader_dayTitle__23ecF").contents[0]
-            date_day_month = clean_html(
-                forecast.find(class_=re.compile("AppForecastDayHeader_dayTitle", re.I)).contents[0]
-            )
+            fields = _day_fields(forecast)
+            date_day_month = parse_day_date(clean_html(_contents(fields["day_title"][0])[0]), index, today)
             magnetic_field = ""
-            fields = forecast.find_all(class_=re.compile("AppForecastDayDuration_item", re.I))
-            for el in fields:
-                if el.text.find("Магнитное поле") >= 0:
-                    magnetic_field = el.contents[1].text
+            for el in fields["duration"]:
+                if el.text_content().find("Магнитное поле") >= 0:
+                    magnetic_field = _text(_contents(el)[1])
                     break
             # part of the day (morning, afternoon, evening, night)
-            fields = forecast.find_all(style=re.compile("-part", re.I))
-            part_day = [el.text for el in fields]
+            part_day = [el.text_content() for el in fields["part_day"]]
             # temperature
-            fields = forecast.find_all(class_=re.compile("AppForecastDayPart_temp", re.I))
-            temperature = [int(el.contents[0][:-1]) for el in fields] # remove the degree sign ('+12°' => 12)
+            temperature = [int(_contents(el)[0][:-1]) for el in fields["temperature"]]  # remove the degree sign ('+12°' => 12)
             temperature_avg = sum(temperature[:-1]) / len(temperature[:-1])
             # pressure
-            fields = forecast.find_all(style=re.compile("-press", re.I))
-            pressure = [int(el.text) for el in fields]
+            pressure = [int(el.text_content()) for el in fields["pressure"]]
             min_, max_ = min(pressure), max(pressure)
             pressure_text = "" if max_ - min_ < 5 else (
                 "ожидается резкое увеличение атмосферного давления" if pressure.index(min_) < pressure.index(max_)
                 else "ожидается резкое падение атмосферного давления")
             # wetness
-            fields = forecast.find_all(style=re.compile("-hum", re.I))
-            wetness = [el.text for el in fields]
+            wetness = [el.text_content() for el in fields["wetness"]]
             # погодное явление (event)
-            fields = forecast.find_all(style=re.compile("-text", re.I))
-            event = [el.text for el in fields]
-
-            result_df = pd.concat([
-                result_df,
-                DataFrame({
-                    "Дата": date_day_month,
-                    "Время суток": part_day,
-                    "Температура": temperature,
-                    "Средняя температура за световой день": temperature_avg,
-                    "Давление": pressure,
-                    "Давление (комментарий)": pressure_text,
-                    "Влажность": wetness,
-                    "Погодное явление": event,
-                    "Магнитное поле": magnetic_field,
-                })],
-                ignore_index=True, sort=False)
+            event = [el.text_content() for el in fields["event"]]
+
+            columns.add_day(date_day_month, part_day, temperature, temperature_avg,
+                            pressure, pressure_text, wetness, event, magnetic_field)
 
         except Exception as err:
             error_msg += f"{err}\n"
 
-    if result_df.empty:
+    if not len(columns):
         error_msg = f"Ошибка парсинга сайта: `{page_address}`"
+    result = {"frame": columns.to_frame, "records": columns.to_records, "arrow": columns.to_arrow}[output]()
+    return result, error_msg
+
+
+async def get_yandex_weather(city: str) -> dict:
+    try:
+        page_address = f"https://yandex.ru/pogoda/ru/{city}"
+        content, source = await fetch_router.fetch(page_address, city=city)
+        # the parsing is CPU-bound: in the process pool, the event loop serves the other chats
+        result_df, error_msg = await cpu_executor.run(parse_forecast_page, content, page_address)
+    except Exception as err:
+        return {"is_error": True, "message": str(err)}
+        # return {"status": MyLogTypeEnum.ERROR, "message": err}
 
-    result = {"message": "", "is_error": False, "result_df": result_df}
+    result = {"message": "", "is_error": False, "result_df": result_df, "source": source}
     if error_msg:
         result["message"] += f"\nError: {error_msg}"
         result["is_error"] = True
@@ -3,23 +3,63 @@ from dependency_injector import containers, providers
 from app.adapters.db_adapter import WeatherParser
 from app.adapters.telegram import TelegramService
 from app.services.dialog_flow import DialogFlow
+from app.services.dialog_state import DialogStateStore
+from app.services.forecast_prefetch import ForecastPrefetcher
+from app.services.job_queue import JobQueue
 from app.services.main_telegram_service import MainTelegramBotService
 from app.settings import PARSED_CONFIG
+from app.utils.scheduler import create_scheduler
 
 
 class ApplicationContainer(containers.DeclarativeContainer):
     """
     The main application container
     """
+    weather_parser = providers.Singleton(
+        WeatherParser,
+        sqlite_db=PARSED_CONFIG.sqlite_db,
+        readers=PARSED_CONFIG.sqlite_readers,
+    )
+    forecast_prefetcher = providers.Singleton(
+        ForecastPrefetcher,
+        weather_parser=weather_parser,
+        config=PARSED_CONFIG.prefetch,
+    )
+    scheduler = providers.Singleton(
+        create_scheduler,
+        prefetcher=forecast_prefetcher,
+    )
+    job_queue = providers.Singleton(
+        JobQueue,
+        workers=PARSED_CONFIG.job_queue.workers,
+        max_size=PARSED_CONFIG.job_queue.queue_size,
+        history=PARSED_CONFIG.job_queue.history,
+    )
     dialog_flow = providers.Singleton(
         DialogFlow,
-        WeatherParser,
+        weather_parser,
+        job_queue=job_queue,
+    )
+    dialog_state = providers.Singleton(
+        DialogStateStore,
+        shards=PARSED_CONFIG.dialog_state.shards,
+        max_size=PARSED_CONFIG.dialog_state.max_size,
+        idle_ttl=PARSED_CONFIG.dialog_state.idle_ttl_sec,
     )
     bot = providers.Singleton(
         TelegramService,
         token=PARSED_CONFIG.telegram_token,
         dialog_flow=dialog_flow,
         proxy=PARSED_CONFIG.proxy,
+        dialog_state=dialog_state,
+        message_window=PARSED_CONFIG.debounce.window_sec,
+        message_max_wait=PARSED_CONFIG.debounce.max_wait_sec,
+        polling=PARSED_CONFIG.polling,
+        webhook=PARSED_CONFIG.webhook,
+        rate_limit=PARSED_CONFIG.rate_limit,
+        media_cache=PARSED_CONFIG.media_cache,
+        layout_cache_size=PARSED_CONFIG.user_prefs_cache.layout_max_size,
+        job_queue=job_queue,
     )
     main_telegram_bot_service = providers.Factory(
         MainTelegramBotService,
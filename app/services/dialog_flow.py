@@ -3,14 +3,39 @@ import datetime
 import re
 import types
 
-from collections.abc import Iterable
-from itertools import chain
+from collections.abc import AsyncGenerator, Iterable
+from io import BytesIO
 
-from aiogram.types import BufferedInputFile
+from aiogram.types import BufferedInputFile, InputFile
 from loguru import logger
 
 from app.adapters.db_adapter import WeatherParser
-from app.utils.utils import run_async, table_writer
+from app.adapters.yandex import forecast_summary
+from app.settings import PARSED_CONFIG
+from app.utils.cache import AsyncTTLCache
+from app.services.job_queue import Job, JobQueue
+from app.utils.executor import cpu_executor
+from app.utils.utils import EXPORT_FORMATS, TableExporter, read_static, table_bytes
+
+# xlsx of the forecast by (city, forecast version) - the same forecast is not written twice
+workbook_cache = AsyncTTLCache(
+    ttl=PARSED_CONFIG.forecast_cache.ttl_sec, max_size=PARSED_CONFIG.forecast_cache.workbook_max_size
+)
+
+
+def compile_command_router(command_dict: dict) -> tuple[dict[str, str], dict[str, str], set[str], re.Pattern]:
+    """
+    Routing table of the commands: alias (lower case) -> flow, alias -> emoji prefix of the button,
+    the aliases of the commands taking a param ("is_param"), one regex removing "/" and the emoji from the text
+    """
+    command_flow, command_img = {}, {}
+    for key, value in command_dict.items():
+        for alias in map(str.lower, value["list"] + [key]):
+            command_flow.setdefault(alias, key)  # the first command of the alias wins
+            command_img.setdefault(alias, f"{value['img']} " if "img" in value else "")
+    command_with_param = {alias for alias, key in command_flow.items() if command_dict[key].get("is_param")}
+    imgs = sorted({value["img"] for value in command_dict.values() if value.get("img")}, key=len, reverse=True)
+    return command_flow, command_img, command_with_param, re.compile("|".join(map(re.escape, ["/"] + imgs)))
 
 
 class DialogFlow(object):
@@ -48,16 +73,31 @@ class DialogFlow(object):
         "flow_weather_get": {
             "description": "Прогноз погоды в Excel",
             "list": ["прогноз погоды в excel"],
+            "is_param": True,
             "img": "🧾",
         },
+        "flow_weather_batch": {
+            "description": "Прогноз погоды по нескольким городам в одном Excel (мои города или список через запятую)",
+            "list": ["прогноз по моим городам", "прогноз по городам", "batch"],
+            "is_param": True,
+            "img": "🗂",
+        },
+        "flow_job_status": {
+            "description": "Статус фоновых задач (формирование файлов прогноза)",
+            "list": ["статус задач", "задачи", "статус", "jobs"],
+            "is_param": True,
+            "img": "⏳",
+        },
         "flow_log_get": {
             "description": "Логи запросов прогноза погоды",
             "list": ["логи", "лог", "лог последних запросов", "история"],
+            "is_param": True,
             "img": "📄",
         },
         "flow_city_get": {
             "description": "Справочник городов",
             "list": ["города", "справочник городов"],
+            "is_param": True,
             "img": "🌇",
         },
         "flow_city_enter": {
@@ -74,66 +114,69 @@ class DialogFlow(object):
     }
 
     command_exit = command_dict["flow_exit"]["list"]
+    command_flow, command_img, command_with_param, command_strip = compile_command_router(command_dict)
+    # the flows starting with a question: after the eviction / restart they are resumed at the first step
+    resumable_flows = ("flow_default", "flow_main_menu", "flow_city_enter", "flow_start")
     button_default = ["Основное меню", "Прогноз погоды" , "Список команд"]
+    city_keyboard = PARSED_CONFIG.city_keyboard
+    # CommandToBack.command -> (method doing the job, title of the job)
+    back_commands = {"weather_get": ("job_weather_get", "Прогноз")}
 
-    def __init__(self, weather_parser: WeatherParser):
+    def __init__(self, weather_parser: WeatherParser, job_queue: JobQueue = None):
         self.weather_parser = weather_parser
-        self.command_list = list(chain.from_iterable([el["list"] for el in self.command_dict.values()])) + list(
-            self.command_dict)
+        self.job_queue = job_queue
+        self.command_list = list(self.command_flow)
 
     def add_img_in_command(self, command: str) -> str:
-        img = ""
-        for key, value in self.command_dict.items():
-            if command.lower() in value["list"] + [key]:
-                try:
-                    img = value["img"] + " "
-                except:
-                    pass
-                break
-        return img + command
+        return self.command_img.get(command.lower(), "") + command
 
     def get_command_from_str(self, arg_str: str) -> tuple:
-        def _is_command_in_dict(command: str) -> bool:
-            for key, value in self.command_dict.items():
-                if command in list(map(str.lower, (value["list"] + [key]))):
-                    return True
-            return False
-
         # remove the img from the content
-        img_list = [self.command_dict[el]["img"] for el in self.command_dict if "img" in self.command_dict[el]]
-        command = re.sub(r"|".join(map(re.escape, ["/"] + img_list)), "", arg_str.lower()).strip()
+        command = self.command_strip.sub("", arg_str.lower()).strip()
 
-        if _is_command_in_dict(command):
+        if command in self.command_flow:
             return command, None
 
-        if len(command.split(" ")) < 2:
-            return None, None
-
-        # finding the index of last space
+        # the longest command taking a param followed by the param: "прогноз по моим городам нижний новгород, казань";
+        # the other texts starting with a command ("привет меня зовут ...") are not commands
         index = command.rfind(" ")
-        command, param = command[:index], command[index + 1:]
-        return (command, param) if _is_command_in_dict(command) else (None, None)
+        while index > 0:
+            prefix = command[:index].rstrip()
+            if prefix in self.command_with_param:
+                return prefix, command[index + 1:].strip()
+            index = command.rfind(" ", 0, index)
+        return None, None
+
+    async def resume_flow(self, flow: str, step: int, chat_id=None, username=None):
+        """
+        The flow waiting for the answer to its first question is started again (the question is not sent)
+        """
+        if flow not in self.resumable_flows or step != 1:
+            return None
+        generator = self.__getattribute__(flow)(chat_id, username)
+        await anext(generator)
+        return generator
 
-    def dialog_flow(self, function_or_generator=None, chat_id=None, username='', text='', param: str = None):
+    async def dialog_flow(self, function_or_generator=None, chat_id=None, username='', text='', param: str = None):
         if self.is_command_dialog_flow(text):  # Ответ является командой
             # выберем и запустим локальный генератор
             function_or_generator = self.get_dialog_flow(text, chat_id=chat_id, username=username, param=param)
-            answer = next(function_or_generator)  # в первый раз - next (.send() срабатывает только после первого yield)
+            answer = await anext(function_or_generator)  # в первый раз - anext (.asend() срабатывает только после первого yield)
         else:
-            if isinstance(function_or_generator, types.GeneratorType):  # если функция - Генератор
+            if isinstance(function_or_generator, types.AsyncGeneratorType):  # если функция - Генератор
                 try:
-                    answer = function_or_generator.send(HTML(text))  # запрос в локальный DialogFlow
-                except StopIteration:  # если генератор закончился, продолжаем общение с DEFAULT
+                    answer = await function_or_generator.asend(HTML(text))  # запрос в локальный DialogFlow
+                except StopAsyncIteration:  # если генератор закончился, продолжаем общение с DEFAULT
                     # function_or_generator = globals()['flow_default'](chat_id, username)
                     function_or_generator = self.__getattribute__("flow_default")(chat_id, username)
-                    answer = next(
-                        function_or_generator)  # в первый раз - next (.send() срабатывает только после первого yield)
+                    answer = await anext(
+                        function_or_generator)  # в первый раз - anext (.asend() срабатывает только после первого yield)
                     # answer = ask_google_dialog_flow(text, chat_id)  # запрос в Google DialogFlow
             else:
                 # function_or_generator = globals()['flow_default'](chat_id, username)
                 function_or_generator = self.__getattribute__("flow_default")(chat_id, username)
-                answer = next(
-                    function_or_generator)  # в первый раз - next (.send() срабатывает только после первого yield)
+                answer = await anext(
+                    function_or_generator)  # в первый раз - anext (.asend() срабатывает только после первого yield)
                 # answer = ask_google_dialog_flow(text, chat_id)  # запрос в Google DialogFlow
         return answer, function_or_generator
 
@@ -145,27 +188,21 @@ class DialogFlow(object):
 
     def is_command_dialog_flow(self, arg_str: str) -> bool:
         command, param = self.get_command_from_str(arg_str)
-        return command in self.command_list
+        return command is not None
 
     def get_dialog_flow(self, arg_str: str, chat_id=None, username=None, param: str = None):
         command, param_ = self.get_command_from_str(arg_str)
-        for key, value in self.command_dict.items():
-            if command in value["list"] + [key]:
-                return self.__getattribute__(key)(chat_id, username, param=(param or param_))
-                # return globals()[key](chat_id, username)
-        return None
+        if command is None:
+            return None
+        return self.__getattribute__(self.command_flow[command])(chat_id, username, param=(param or param_))
 
-    def flow_start(self, chat_id=None, username=None, *args, **kwargs):
+    async def flow_start(self, chat_id=None, username=None, *args, **kwargs):
         """
         *********************************************************************
          DialogFlow стартовый, для ...
         *********************************************************************
         """
-        try:
-            with open("app/static/megafon_logo.png", "rb") as in_file:  # opening for [r]eading as [b]inary
-                logo = in_file.read()
-        except:
-            logo = None
+        logo = read_static("app/static/megafon_logo.png")
 
         answer = yield (
             Photo(logo) if logo else None,
@@ -177,22 +214,23 @@ class DialogFlow(object):
         # первую компоненту имени, пишем её с заглавной буквы
         try:
             username = answer.text.rstrip(".!").capitalize()
-            result = run_async(self.weather_parser.user_add, self.weather_parser, chat_id, username)
+            result = await self.weather_parser.user_add(chat_id, username)
         except:
             pass
 
         answer = yield "Отлично!", self.button_default
-        return answer
 
-    def flow_default(self, chat_id=None, username=None, *args, **kwargs):
+    async def flow_default(self, chat_id=None, username=None, *args, **kwargs):
         """
         *********************************************************************
          DialogFlow "by default"
         *********************************************************************
         """
-        answer, choice = yield from self.ask_list_answer(HTML(f"<b>{username}</b>, сделайте выбор:"),
-                                                         self.button_default)
-        return answer
+        # `yield from self.ask_list_answer(...)` is not available in the async generator
+        list_answer = list(self.flatten_lower(self.button_default))
+        answer = yield HTML(f"<b>{username}</b>, сделайте выбор:"), self.button_default
+        while not (answer.text.lower() in list_answer):
+            answer = yield HTML("Прошу ввести вариант или нажать кнопку?")
 
     def flow_exit(self, chat_id=None, username=None, *args, **kwargs):
         """
@@ -202,7 +240,7 @@ class DialogFlow(object):
         """
         return self.flow_default(chat_id, username, *args, **kwargs)
 
-    def flow_help(self, chat_id=None, username=None, *args, **kwargs):
+    async def flow_help(self, chat_id=None, username=None, *args, **kwargs):
         """
         *********************************************************************
          Dialog Flow to display a list of commands
@@ -212,9 +250,8 @@ class DialogFlow(object):
         for el in self.command_dict.values():
             answer += f"\n<b>{el['list'][0]}</b> - {el['description']}\n<i>{el['list'][1:]}</i>"
         answer = yield HTML(f"Перечень <b>команд</b>:\n{answer}"), self.button_default
-        return answer
 
-    def flow_main_menu(self, chat_id=None, username=None, *args, **kwargs):
+    async def flow_main_menu(self, chat_id=None, username=None, *args, **kwargs):
         """
         *********************************************************************
          Dialog Flow for main Menu
@@ -222,49 +259,56 @@ class DialogFlow(object):
         """
         main_menu = ["Прогноз погоды", "Информация обо мне", "Лог последних запросов"]
         answer = ""
-        while not answer or answer.text.lower() in self.command_list:
+        while not answer or answer.text.lower() in self.command_flow:
             answer = yield HTML(f"Просьба выбрать <b>действие</b>:"), main_menu
 
-        return answer
-
-    def flow_user_get(self, chat_id=None, username=None, *args, **kwargs):
+    async def flow_user_get(self, chat_id=None, username=None, *args, **kwargs):
         """
         *********************************************************************
          Dialog Flow for getting User info
         *********************************************************************
         """
-        content = run_async(self.weather_parser.user_get, self.weather_parser, chat_id)
+        content = await self.weather_parser.user_get(chat_id)
         answer = yield HTML(str(content)), self.button_default
-        return answer
 
-    def flow_log_get(self, chat_id=None, username=None, *args, **kwargs):
+    async def flow_log_get(self, chat_id=None, username=None, *args, **kwargs):
         """
         *********************************************************************
          Dialog Flow for getting last logs
+         ("лог csv" / "лог parquet" / "лог arrow" - the whole Log as a file)
         *********************************************************************
         """
-        content = run_async(self.weather_parser.log_get, self.weather_parser)
+        param = (kwargs.get("param") or "").lower()
+        if param in EXPORT_FORMATS:
+            with TableExporter(param=param, schema=self.weather_parser.log_export_schema) as exporter:
+                async for chunk in self.weather_parser.log_iter():
+                    exporter.write(chunk)
+            # the buffer itself is sent (getvalue() would be the second copy of the file)
+            answer = yield File(exporter.output, f"{datetime.date.today()}_log.{EXPORT_FORMATS[param]}"), \
+                self.button_default
+            return
+        content = await self.weather_parser.log_get()
         answer = yield HTML(str(content)), self.button_default
-        return answer
 
-    def flow_weather_menu(self, chat_id=None, username=None, *args, **kwargs):
+    async def flow_weather_menu(self, chat_id=None, username=None, *args, **kwargs):
         """
         *********************************************************************
          Dialog Flow to ...
         *********************************************************************
         """
-        result = run_async(self.weather_parser.user_city_get, chat_id)
+        result = await self.weather_parser.user_city_get(chat_id)
         button = [["Ввести город (первые буквы) вручную", "flow_city_enter"], ["Основное меню", "Основное меню"]]
         if result is None:
             content = "Ваша история парсинга по городам пуста"
         else:
             content = "Выберите город:"
             button += [[el['name_ru'].capitalize(), f"flow_weather_get {el['name_en']}"] for el in result]
+            if len(result) > 1:
+                button.insert(1, ["Прогноз по моим городам", "flow_weather_batch"])
 
         answer = yield HTML(content), button
-        return answer
 
-    def flow_city_enter(self, chat_id=None, username=None, *args, **kwargs):
+    async def flow_city_enter(self, chat_id=None, username=None, *args, **kwargs):
         """
         *********************************************************************
          Dialog Flow for getting City name from chat
@@ -275,8 +319,8 @@ class DialogFlow(object):
             answer = yield HTML(f"Просьба ввести <b>наименование города</b> <i>(несколько первых букв)</i>, "
                                 f"или нажать кнопку <b>ВЫЙТИ</b>:"), ["Выйти"]
             if answer.text.lower() in self.command_exit:
-                return answer
-            result = run_async(self.weather_parser.city_get, self.weather_parser, answer.text)
+                return
+            result = await self.weather_parser.city_find(answer.text)
             if not result:
                 answer = yield HTML(f"Города, включающего `{answer.text}` в справочнике не обнаружено..."), ["Основное меню"]
 
@@ -285,35 +329,177 @@ class DialogFlow(object):
         # else:
         button = [["Основное меню", "Основное меню"]] + [[el['name_ru'].capitalize(), f"flow_weather_get {el['name_en']}"] for el in result]
         answer = yield HTML("Выберите город:"), button
-        return answer
 
-    def flow_weather_get(self, chat_id=None, username=None, *args, **kwargs):
+    async def flow_weather_get(self, chat_id=None, username=None, *args, **kwargs):
         city = kwargs['param']
-        result = run_async(self.weather_parser.weather_get, self.weather_parser, chat_id, city)
+        if self.job_queue is not None:
+            # the file is made by the job queue and sent by TelegramService when it is ready
+            answer = yield HTML(f"Прогноз <b>{city}</b> готовится, файл придёт отдельным сообщением"), \
+                CommandToBack(chat_id, "weather_get", city)
+            return
+        result = await self.weather_parser.weather_get(chat_id, city)
         if result["is_error"]:
             answer = yield HTML(result["message"]), self.button_default
         else:
-            stream = table_writer(dataframes={f"{city}": result["result_df"]}, param="xlsx")
-            answer = yield File(stream.getvalue(), f"{datetime.date.today()}_{city}.xlsx"), self.button_default
-        return answer
+            answer = yield File(await self.forecast_workbook(city, result), f"{datetime.date.today()}_{city}.xlsx"), \
+                self.button_default
 
-    def flow_city_get(self, chat_id=None, username=None, *args, **kwargs):
+    async def back_command(self, job: Job, command: str, chat_id=None, content: str = None):
+        """
+        Job of the CommandToBack (`back_commands`), returns the answer to the chat
+        """
+        return await self.__getattribute__(self.back_commands[command][0])(job, chat_id, content)
+
+    async def job_weather_get(self, job: Job, chat_id=None, city: str = None):
+        await job.progress(10, "загрузка прогноза")
+        result = await self.weather_parser.weather_get(chat_id, city)
+        if result["is_error"]:
+            return HTML(result["message"]), self.button_default
+        await job.progress(70, "формирование xlsx")
+        content = await self.forecast_workbook(city, result)
+        return File(content, f"{datetime.date.today()}_{city}.xlsx"), self.button_default
+
+    @staticmethod
+    async def forecast_workbook(city: str, result: dict) -> bytes:
+        """
+        xlsx of the forecast (cached by the forecast version), written in the process pool
+        """
+        key = (city.lower(), result.get("fetched_at"))
+        content = workbook_cache.get(key) if key[1] is not None else None
+        if content is None:
+            content = await cpu_executor.run(table_bytes, {f"{city}": result["result_df"]}, "xlsx")
+            if key[1] is not None:
+                workbook_cache.set(key, content)
+        return content
+
+    async def flow_weather_batch(self, chat_id=None, username=None, *args, **kwargs):
         """
         *********************************************************************
-         Dialog Flow for getting City from spr
+         Dialog Flow for the forecast of several cities in one Excel
+         (a sheet per city and the summary sheet)
         *********************************************************************
         """
-        result = run_async(self.weather_parser.city_get, self.weather_parser)
-        if result is None:
-            content = "Справочник городов пуст"
-            button = self.button_default
+        max_cities = PARSED_CONFIG.weather_batch.max_cities
+        if kwargs.get("param"):
+            cities = await self.cities_from_text(kwargs["param"])
         else:
-            content = "Выберите город:"
-            button = [[el['name_ru'], f"flow_weather_get {el['name_en']}"] for el in result]
-            button.append(["Основное меню", "Основное меню"])
+            cities = [el["name_en"] for el in await self.weather_parser.user_city_get(chat_id, max_cities) or []]
+        if not cities:
+            answer = yield HTML("Просьба ввести <b>города через запятую</b> <i>(например: Москва, Казань)</i>, "
+                                "или нажать кнопку <b>ВЫЙТИ</b>:"), ["Выйти"]
+            if answer.text.lower() in self.command_exit:
+                return
+            cities = await self.cities_from_text(answer.text)
+            if not cities:
+                answer = yield HTML(f"Города `{answer.text}` в справочнике не обнаружены..."), self.button_default
+                return
+
+        results = await self.weather_parser.weather_batch_get(chat_id, cities[:max_cities])
+        dataframes = {"Сводка": forecast_summary(results)}
+        # the sheet name in Excel is at most 31 characters
+        dataframes |= {city[:31]: result["result_df"] for city, result in results.items() if not result["is_error"]}
+        content = await cpu_executor.run(table_bytes, dataframes, "xlsx")
+        answer = yield File(content, f"{datetime.date.today()}_cities_{len(results)}.xlsx"), \
+            self.button_default
+
+    async def cities_from_text(self, text: str) -> list[str]:
+        """'Москва, kazan; Питер' -> ["moscow", "kazan", "saint-petersburg"] (the best match from the directory)"""
+        cities = []
+        for name in re.split(r"[,;\n]", text):
+            if name.strip():
+                found = await self.weather_parser.city_find(name, limit=1)
+                if found:
+                    cities.append(found[0]["name_en"])
+        return list(dict.fromkeys(cities))
+
+    async def flow_job_status(self, chat_id=None, username=None, *args, **kwargs):
+        """
+        *********************************************************************
+         Dialog Flow to display the background jobs of the chat (param - number of the job)
+        *********************************************************************
+        """
+        if self.job_queue is None:
+            answer = yield HTML("Фоновые задачи не используются"), self.button_default
+            return
+        param = (kwargs.get("param") or "").lstrip("#")
+        job = self.job_queue.get(int(param)) if param.isdigit() else None
+        if job is not None and job.chat_id == chat_id:
+            jobs = [job]
+        else:
+            jobs = self.job_queue.chat_jobs(chat_id)
+        content = "\n".join(job.describe() for job in jobs) if jobs else "Задач нет"
+        answer = yield HTML(content), self.button_default
+
+    async def flow_city_get(self, chat_id=None, username=None, *args, **kwargs):
+        """
+        *********************************************************************
+         Dialog Flow for getting City from spr: the paged keyboard of the regions (letters),
+         then the paged keyboard of the cities of the region; param - "<page>" or "b<region>.<page>"
+        *********************************************************************
+        """
+        buckets = await self.weather_parser.city_buckets_get()
+        if not buckets:
+            answer = yield HTML("Справочник городов пуст"), self.button_default
+            return
+        number, page = self.city_page_param(kwargs.get("param"))
+        if number is None or number >= len(buckets):
+            content, button = self._city_buckets_page(buckets, page)
+        else:
+            content, button = await self._city_page(buckets, number, page)
+        button.append(["Основное меню", "Основное меню"])
 
         answer = yield HTML(content), button
-        return answer
+
+    @staticmethod
+    def city_page_param(param: str = None) -> tuple:
+        """(group number | None, page) from the param of `flow_city_get`"""
+        try:
+            if param and param.startswith("b"):
+                number, page = param[1:].split(".")
+                return int(number), max(int(page), 0)
+            return None, max(int(param or 0), 0)
+        except ValueError:
+            return None, 0
+
+    @staticmethod
+    def _city_bucket_title(bucket: dict) -> str:
+        if "region" in bucket:
+            return bucket["region"] or "Без региона"
+        return bucket["letter"].upper()
+
+    @staticmethod
+    def _city_page_buttons(page: int, pages: int, command: str) -> list:
+        button = []
+        if page > 0:
+            button.append(["◀️ Назад", f"{command}{page - 1}"])
+        if page < pages - 1:
+            button.append(["Вперёд ▶️", f"{command}{page + 1}"])
+        return button
+
+    def _city_buckets_page(self, buckets: list[dict], page: int) -> tuple:
+        size = self.city_keyboard.buckets_page_size
+        pages = -(-len(buckets) // size)
+        page = min(page, pages - 1)
+        button = [
+            [f"{self._city_bucket_title(bucket)} ({bucket['count']})", f"flow_city_get b{number}.0"]
+            for number, bucket in enumerate(buckets[page * size:(page + 1) * size], start=page * size)
+        ]
+        button += self._city_page_buttons(page, pages, "flow_city_get ")
+        content = "Выберите регион:" if "region" in buckets[0] else "Выберите первую букву города:"
+        return (f"{content} <i>(стр. {page + 1} из {pages})</i>" if pages > 1 else content), button
+
+    async def _city_page(self, buckets: list[dict], number: int, page: int) -> tuple:
+        size = self.city_keyboard.page_size
+        bucket = buckets[number]
+        pages = max(-(-bucket["count"] // size), 1)
+        page = min(page, pages - 1)
+        result = await self.weather_parser.city_page_get(bucket, page * size, size)
+        button = [[el['name_ru'].capitalize(), f"flow_weather_get {el['name_en']}"] for el in result]
+        button += self._city_page_buttons(page, pages, f"flow_city_get b{number}.")
+        # back to the page of the groups with this group
+        button.append(["К списку", f"flow_city_get {number // self.city_keyboard.buckets_page_size}"])
+        content = f"<b>{self._city_bucket_title(bucket)}</b>: выберите город:"
+        return (f"{content} <i>(стр. {page + 1} из {pages})</i>" if pages > 1 else content), button
 
     '''
     *********************************************************************
@@ -412,10 +598,27 @@ class Photo(object):
         self.content = content
 
 
-# Класс для файлов
+class BytesIOInputFile(InputFile):
+    """
+    Upload of the BytesIO content by the chunks of its buffer view: the content is not copied into bytes
+    """
+
+    def __init__(self, buffer: BytesIO, filename: str, chunk_size: int = 65536):
+        super().__init__(filename=filename, chunk_size=chunk_size)
+        self.data = buffer.getbuffer()
+
+    async def read(self, bot) -> AsyncGenerator[bytes, None]:
+        for start in range(0, len(self.data), self.chunk_size):
+            yield bytes(self.data[start:start + self.chunk_size])
+
+
+# Класс для файлов (bytes или BytesIO - большой файл без копии)
 class File(object):
-    def __init__(self, file: bytes = None, file_name: str = "file_name.txt", content: str = None, **options):
-        self.file = BufferedInputFile(file, file_name) if file else None
+    def __init__(self, file: bytes | BytesIO = None, file_name: str = "file_name.txt", content: str = None, **options):
+        if isinstance(file, BytesIO):
+            self.file = BytesIOInputFile(file, file_name) if file.getbuffer().nbytes else None
+        else:
+            self.file = BufferedInputFile(file, file_name) if file else None
         self.content = content
 
 
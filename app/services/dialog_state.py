@@ -0,0 +1,145 @@
+import math
+import time
+from collections import OrderedDict
+from typing import Hashable, Optional
+
+
+class DialogState:
+    __slots__ = ("generator", "flow", "step", "touched")
+
+    def __init__(self, generator, flow: Optional[str], step: int):
+        self.generator = generator
+        self.flow = flow
+        self.step = step
+        self.touched = time.monotonic()
+
+
+class DialogStateStore:
+    """
+    Per-chat state of the DialogFlow: the live generator plus its resumable point (flow name, step).
+    Chats are split into shards (OrderedDict by the last access), every shard is bounded (LRU)
+    and drops the chats idle for `idle_ttl` seconds; the generator of the evicted chat is released,
+    only the small (flow, step) point is kept - the chat is resumed from it (`pop_resume_point`)
+    """
+
+    def __init__(self, shards: int = 16, max_size: int = 10000, idle_ttl: float = 1800):
+        self.shards_count = shards
+        self.max_size = max_size
+        self.shard_size = max(1, math.ceil(max_size / shards))
+        self.idle_ttl = idle_ttl
+        self._shards: list[OrderedDict[Hashable, DialogState]] = [OrderedDict() for _ in range(shards)]
+        # chat_id -> (flow, step) of the evicted / restored chats
+        self._resume: OrderedDict[Hashable, tuple[str, int]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions_lru = 0
+        self.evictions_idle = 0
+        self.resumed = 0
+
+    def _shard(self, chat_id: Hashable) -> OrderedDict:
+        return self._shards[hash(chat_id) % self.shards_count]
+
+    def _evict_idle(self, shard: OrderedDict, now: float):
+        # the shard is ordered by the last access - the idle chats are at the beginning
+        while shard:
+            chat_id, state = next(iter(shard.items()))
+            if now - state.touched < self.idle_ttl:
+                break
+            shard.popitem(last=False)
+            self._keep_resume_point(chat_id, state)
+            self.evictions_idle += 1
+
+    def _keep_resume_point(self, chat_id: Hashable, state: DialogState):
+        if state.flow:
+            self._resume[chat_id] = (state.flow, state.step)
+            self._resume.move_to_end(chat_id)
+            while len(self._resume) > self.max_size:
+                self._resume.popitem(last=False)
+
+    def __len__(self) -> int:
+        return sum(map(len, self._shards))
+
+    def __contains__(self, chat_id: Hashable) -> bool:
+        shard = self._shard(chat_id)
+        self._evict_idle(shard, time.monotonic())
+        return chat_id in shard
+
+    def get(self, chat_id: Hashable, default=None):
+        shard = self._shard(chat_id)
+        now = time.monotonic()
+        self._evict_idle(shard, now)
+        state = shard.get(chat_id)
+        if state is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        state.touched = now
+        shard.move_to_end(chat_id)
+        return state.generator
+
+    def __getitem__(self, chat_id: Hashable):
+        if chat_id not in self:
+            raise KeyError(chat_id)
+        return self.get(chat_id)
+
+    def __setitem__(self, chat_id: Hashable, generator):
+        """The same generator - the next step of the flow, a new one - the first step"""
+        shard = self._shard(chat_id)
+        now = time.monotonic()
+        self._evict_idle(shard, now)
+        state = shard.get(chat_id)
+        if generator is None:
+            state = DialogState(None, None, 0)
+        elif state is not None and state.generator is generator:
+            state.step += 1
+        else:
+            state = DialogState(generator, getattr(generator, "__name__", None), 1)
+        state.touched = now
+        shard[chat_id] = state
+        shard.move_to_end(chat_id)
+        self._resume.pop(chat_id, None)
+        while len(shard) > self.shard_size:
+            evicted_id, evicted = shard.popitem(last=False)
+            self._keep_resume_point(evicted_id, evicted)
+            self.evictions_lru += 1
+
+    def pop(self, chat_id: Hashable, default=None):
+        self._resume.pop(chat_id, None)
+        state = self._shard(chat_id).pop(chat_id, None)
+        return default if state is None else state.generator
+
+    def pop_resume_point(self, chat_id: Hashable) -> Optional[tuple[str, int]]:
+        point = self._resume.pop(chat_id, None)
+        if point is not None:
+            self.resumed += 1
+        return point
+
+    def evict_idle(self):
+        now = time.monotonic()
+        for shard in self._shards:
+            self._evict_idle(shard, now)
+
+    def snapshot(self) -> list[tuple[Hashable, str, int]]:
+        """(chat_id, flow, step) of all the chats - to be saved before the restart"""
+        result = {chat_id: point for chat_id, point in self._resume.items()}
+        for shard in self._shards:
+            result.update({chat_id: (state.flow, state.step) for chat_id, state in shard.items() if state.flow})
+        return [(chat_id, flow, step) for chat_id, (flow, step) in result.items()]
+
+    def restore(self, points: list[tuple[Hashable, str, int]]):
+        for chat_id, flow, step in points[-self.max_size:]:
+            if chat_id not in self._shard(chat_id):
+                self._resume[chat_id] = (flow, step)
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self),
+            "max_size": self.max_size,
+            "shards": self.shards_count,
+            "resume_points": len(self._resume),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions_lru": self.evictions_lru,
+            "evictions_idle": self.evictions_idle,
+            "resumed": self.resumed,
+        }
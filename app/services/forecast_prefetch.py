@@ -0,0 +1,47 @@
+import asyncio
+import time
+
+from loguru import logger
+
+from app.adapters.db_adapter import WeatherParser
+from app.settings import PrefetchConfig
+
+
+class ForecastPrefetcher:
+    """
+    Background refresh of the forecasts for the popular cities (User_City / Log),
+    so the user requests for them are served from the cache
+    """
+
+    def __init__(self, weather_parser: WeatherParser, config: PrefetchConfig):
+        self.weather_parser = weather_parser
+        self.config = config
+        self.runs = 0
+        self.refreshed = 0
+        self.failed = 0
+
+    async def _refresh_city(self, city: str, limit: asyncio.Semaphore) -> bool:
+        async with limit:
+            try:
+                result = await self.weather_parser.forecast_refresh(city)
+            except Exception as err:
+                logger.error(f"prefetch `{city}`: {err}")
+                return False
+        return not result["is_error"]
+
+    async def refresh(self) -> dict:
+        start = time.monotonic()
+        cities = await self.weather_parser.city_popular_get(self.config.top_cities, self.config.window_hours)
+        limit = asyncio.Semaphore(self.config.concurrency)
+        results = await asyncio.gather(*[self._refresh_city(city, limit) for city in cities])
+
+        self.runs += 1
+        self.refreshed += sum(results)
+        self.failed += len(results) - sum(results)
+        stats = {
+            "cities": len(cities),
+            "refreshed": sum(results),
+            "seconds": round(time.monotonic() - start, 2),
+        }
+        logger.info(f"forecast prefetch: {stats}")
+        return stats
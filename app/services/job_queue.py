@@ -0,0 +1,158 @@
+import asyncio
+import itertools
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+from loguru import logger
+
+from app.utils.executor import CpuExecutor, cpu_executor
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+
+class Job:
+    """
+    Background job of a chat: `func(job, *args)` is awaited by a worker of the `JobQueue`,
+    the function reports its stage by `await job.progress(...)`, its result is `job.result`
+    """
+
+    def __init__(self, job_id: int, queue: "JobQueue", chat_id: Hashable, title: str,
+                 func: Callable[..., Awaitable], args: tuple,
+                 on_progress: Callable[["Job"], Awaitable] = None, on_done: Callable[["Job"], Awaitable] = None):
+        self.id = job_id
+        self.queue = queue
+        self.chat_id = chat_id
+        self.title = title
+        self.func = func
+        self.args = args
+        self.on_progress = on_progress
+        self.on_done = on_done
+        self.status = QUEUED
+        self.stage = "в очереди"
+        self.percent = 0
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.created = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+
+    async def progress(self, percent: int, stage: str):
+        self.percent, self.stage = percent, stage
+        await self._notify(self.on_progress)
+
+    async def run_cpu(self, func: Callable, *args) -> Any:
+        """CPU-bound `func(*args)` in the process pool (`func` and the args are pickled)"""
+        return await self.queue.executor.run(func, *args)
+
+    async def _notify(self, callback: Callable[["Job"], Awaitable]):
+        if callback is None:
+            return
+        try:
+            await callback(self)
+        except Exception as err:  # the job does not fail because of the notification
+            logger.warning(f"job {self.id}: notification failed: {err}")
+
+    def describe(self) -> str:
+        icon = {QUEUED: "⏳", RUNNING: "⚙️", DONE: "✅", FAILED: "❌"}[self.status]
+        text = f"{icon} Задача #{self.id} ({self.title}): {self.stage}"
+        if self.status == RUNNING:
+            text += f" — {self.percent}%"
+        if self.finished is not None:
+            text += f" за {self.finished - (self.started or self.created):.1f} сек"
+        return text
+
+
+class JobQueue:
+    """
+    In-process job queue: `workers` tasks await the jobs (I/O), the CPU-bound parts of the jobs
+    go to the process pool (`Job.run_cpu`); the finished jobs are kept (`history`) for the status requests
+    """
+
+    def __init__(self, workers: int = 4, max_size: int = 100, history: int = 1000, executor: CpuExecutor = None):
+        self.workers_count = workers
+        self.max_size = max_size
+        self.history = history
+        self.executor = executor or cpu_executor
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: list[asyncio.Task] = []
+        self._notifications: set[asyncio.Task] = set()
+        self._jobs: OrderedDict[int, Job] = OrderedDict()
+        self._ids = itertools.count(1)
+        self.done = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def submit(self, func: Callable[..., Awaitable], *args, chat_id: Hashable = None, title: str = "",
+               on_progress: Callable[[Job], Awaitable] = None, on_done: Callable[[Job], Awaitable] = None) -> Optional[Job]:
+        """The job is queued; None - the queue is full"""
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.max_size)
+            self._workers = [asyncio.create_task(self._work()) for _ in range(self.workers_count)]
+        job = Job(next(self._ids), self, chat_id, title, func, args, on_progress, on_done)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            return None
+        self._jobs[job.id] = job
+        while len(self._jobs) > self.history and next(iter(self._jobs.values())).finished is not None:
+            self._jobs.popitem(last=False)
+        return job
+
+    async def _work(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                job.status, job.started, job.stage = RUNNING, time.time(), "выполняется"
+                await job._notify(job.on_progress)
+                job.result = await job.func(job, *job.args)
+                job.status, job.stage, job.percent = DONE, "готово", 100
+                self.done += 1
+            except asyncio.CancelledError:
+                job.status, job.stage, job.error = FAILED, "отменена", "cancelled"
+                raise
+            except Exception as err:
+                job.status, job.stage, job.error = FAILED, "ошибка", str(err)
+                self.failed += 1
+                logger.error(f"job {job.id} ({job.title}): {err}")
+            finally:
+                job.finished = time.time()
+                self._queue.task_done()
+            # the delivery of the result (rate limits of the chat) does not hold the worker
+            notification = asyncio.create_task(job._notify(job.on_done))
+            self._notifications.add(notification)
+            notification.add_done_callback(self._notifications.discard)
+
+    def get(self, job_id: int) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def chat_jobs(self, chat_id: Hashable, limit: int = 5) -> list[Job]:
+        """The last jobs of the chat, the newest first"""
+        result = []
+        for job in reversed(self._jobs.values()):
+            if job.chat_id == chat_id:
+                result.append(job)
+                if len(result) >= limit:
+                    break
+        return result
+
+    async def close(self):
+        tasks = self._workers + list(self._notifications)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers, self._queue = [], None
+
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers_count,
+            "depth": self.depth(),
+            "running": sum(job.status == RUNNING for job in self._jobs.values()),
+            "done": self.done,
+            "failed": self.failed,
+            "rejected": self.rejected,
+        }
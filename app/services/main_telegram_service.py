@@ -3,9 +3,12 @@ import base64
 
 from loguru import logger
 
+from app.adapters.base import browser_pool, page_fetcher
 from app.adapters.telegram import TelegramService
 from app.schemes import MessageScheme
 from app.services.dialog_flow import HTML, Photo
+from app.services.outbound import BROADCAST
+from app.utils.executor import cpu_executor
 
 
 class MainTelegramBotService:
@@ -32,7 +35,11 @@ class MainTelegramBotService:
                 Photo(base64.b64decode(message.image)) if message.image else None,
                 message.button,
             ),
+            priority=BROADCAST,
         )
 
     async def close(self):
         await self.bot.close()
+        await page_fetcher.close()
+        await browser_pool.close()
+        cpu_executor.close()
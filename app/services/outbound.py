@@ -0,0 +1,186 @@
+import asyncio
+import heapq
+import itertools
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+from aiogram.exceptions import TelegramRetryAfter
+from loguru import logger
+
+from app.settings import RateLimit
+
+INTERACTIVE, BROADCAST = 0, 1  # priority lanes: the replies to the users go before the broadcast
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self) -> float:
+        """Seconds until a token is available"""
+        self._refill()
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self._refill()
+        self.tokens -= 1
+
+
+class PriorityRateLimiter:
+    """
+    Token buckets shared by all the chats (per second / per minute); the waiting senders get the tokens
+    by priority (then in the order of arrival)
+    """
+
+    def __init__(self, buckets: list[TokenBucket]):
+        self.buckets = buckets
+        self._waiters: list[tuple[int, int, asyncio.Future]] = []
+        self._order = itertools.count()
+        self._granter: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self, priority: int = INTERACTIVE):
+        if not self._waiters and all(bucket.delay() == 0 for bucket in self.buckets):
+            for bucket in self.buckets:
+                bucket.take()
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._order), future))
+        if self._granter is None or self._granter.done():
+            self._granter = asyncio.create_task(self._grant())
+        await future
+
+    async def _grant(self):
+        while self._waiters:
+            delay = max((bucket.delay() for bucket in self.buckets), default=0)
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            *_, future = heapq.heappop(self._waiters)
+            if future.done():  # the waiter is cancelled
+                continue
+            for bucket in self.buckets:
+                bucket.take()
+            future.set_result(None)
+
+
+class _Job:
+    __slots__ = ("method", "kwargs", "priority", "future", "queued")
+
+    def __init__(self, method: Callable[..., Awaitable], kwargs: dict, priority: int, future: asyncio.Future):
+        self.method = method
+        self.kwargs = kwargs
+        self.priority = priority
+        self.future = future
+        self.queued = time.monotonic()
+
+
+class OutboundDispatcher:
+    """
+    Outbound Telegram calls: FIFO per chat (a drain task per chat with the queued calls), token bucket
+    per chat and the global one (`RateLimit`), the call is repeated after Telegram "retry after"
+    """
+
+    def __init__(self, config: RateLimit = None):
+        self.config = config or RateLimit()
+        self.limiter = PriorityRateLimiter(
+            [TokenBucket(self.config.second, self.config.second), TokenBucket(self.config.minute / 60, self.config.minute)]
+            if self.config.is_enable else []
+        )
+        self._chats: dict[Hashable, deque[_Job]] = {}
+        self._chat_buckets: dict[Hashable, TokenBucket] = {}
+        self._drains: dict[Hashable, asyncio.Task] = {}
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+        self.wait_max = 0.0
+
+    async def send(self, chat_id: Hashable, method: Callable[..., Awaitable], priority: int = INTERACTIVE,
+                   **kwargs) -> Any:
+        """`await method(chat_id=chat_id, **kwargs)` in the turn of the chat; returns its result"""
+        future = asyncio.get_running_loop().create_future()
+        self._chats.setdefault(chat_id, deque()).append(_Job(method, kwargs, priority, future))
+        if chat_id not in self._drains:
+            self._drains[chat_id] = asyncio.create_task(self._drain(chat_id))
+        return await future
+
+    async def _drain(self, chat_id: Hashable):
+        queue = self._chats[chat_id]
+        try:
+            while queue:
+                job = queue[0]
+                try:
+                    if job.future.done():  # the sender does not wait any more
+                        continue
+                    result = await self._call(chat_id, job)
+                except asyncio.CancelledError:
+                    job.future.cancel()
+                    raise
+                except Exception as err:
+                    self.failed += 1
+                    if not job.future.done():
+                        job.future.set_exception(err)
+                else:
+                    if not job.future.done():
+                        job.future.set_result(result)
+                finally:
+                    queue.popleft()
+        finally:
+            del self._drains[chat_id]
+            for job in queue:  # the drain is cancelled
+                job.future.cancel()
+            self._chats.pop(chat_id, None)
+            if len(self._chat_buckets) > 10 * (len(self._chats) + 100):
+                self._chat_buckets.clear()  # the idle chats have full buckets anyway
+
+    async def _call(self, chat_id: Hashable, job: _Job) -> Any:
+        for attempt in range(self.config.retries + 1):
+            if self.config.is_enable:
+                bucket = self._chat_buckets.get(chat_id)
+                if bucket is None:
+                    bucket = self._chat_buckets[chat_id] = TokenBucket(self.config.chat_second, self.config.chat_burst)
+                await asyncio.sleep(bucket.delay())
+                bucket.take()
+                await self.limiter.acquire(job.priority)
+            self.wait_max = max(self.wait_max, time.monotonic() - job.queued)
+            try:
+                result = await job.method(chat_id=chat_id, **job.kwargs)
+                self.sent += 1
+                return result
+            except TelegramRetryAfter as err:
+                if attempt >= self.config.retries:
+                    raise
+                self.retried += 1
+                logger.warning(f"chat {chat_id}: Telegram flood control, retry in {err.retry_after} sec")
+                await asyncio.sleep(err.retry_after)
+
+    async def close(self):
+        drains = list(self._drains.values())
+        for drain in drains:
+            drain.cancel()
+        await asyncio.gather(*drains, return_exceptions=True)
+
+    def depth(self) -> int:
+        return sum(map(len, self._chats.values()))
+
+    def stats(self) -> dict:
+        return {
+            "depth": self.depth(),
+            "chats": len(self._chats),
+            "waiting_tokens": len(self.limiter),
+            "sent": self.sent,
+            "retried": self.retried,
+            "failed": self.failed,
+            "wait_max": round(self.wait_max, 3),
+        }
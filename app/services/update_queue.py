@@ -0,0 +1,93 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Hashable
+
+from aiogram.types.update import UpdateTypeLookupError
+from loguru import logger
+
+
+def update_chat_id(update) -> Hashable:
+    """Chat of the Telegram update (the key of its ordering); update_id - if the update has no chat"""
+    try:
+        event = update.event
+    except UpdateTypeLookupError:
+        return update.update_id
+    chat = getattr(event, "chat", None)
+    if chat is None and getattr(event, "message", None) is not None:  # callback_query
+        chat = event.message.chat
+    if chat is not None:
+        return chat.id
+    user = getattr(event, "from_user", None)
+    return user.id if user is not None else update.update_id
+
+
+class ShardedUpdateQueue:
+    """
+    Bounded queue of the updates processed by `workers` tasks: the updates of one chat go to one shard
+    (`chat_id % workers`) and are processed in order, the different chats - in parallel
+    """
+
+    def __init__(self, handler: Callable[[Any], Awaitable], workers: int = 16, max_size: int = 1000,
+                 key: Callable[[Any], Hashable] = update_chat_id):
+        self.handler = handler
+        self.key = key
+        self.workers_count = workers
+        self._queues = [asyncio.Queue(maxsize=max(1, max_size // workers)) for _ in range(workers)]
+        self._workers: list[asyncio.Task] = []
+        self.accepted = 0
+        self.rejected = 0
+        self.processed = 0
+        self.failed = 0
+        self.latency_max = 0.0
+
+    def start(self):
+        if not self._workers:
+            self._workers = [asyncio.create_task(self._work(queue)) for queue in self._queues]
+
+    async def stop(self, timeout: float = 10):
+        """The queued updates are processed (at most `timeout` seconds), then the workers are stopped"""
+        try:
+            await asyncio.wait_for(asyncio.gather(*[queue.join() for queue in self._queues]), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"update queue is stopped with {self.depth()} updates")
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def put(self, update) -> bool:
+        """False - the shard of the chat is full (the sender should retry later)"""
+        try:
+            self._queues[hash(self.key(update)) % self.workers_count].put_nowait((time.monotonic(), update))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            return False
+        self.accepted += 1
+        return True
+
+    async def _work(self, queue: asyncio.Queue):
+        while True:
+            received, update = await queue.get()
+            try:
+                await self.handler(update)
+                self.processed += 1
+            except Exception as err:
+                self.failed += 1
+                logger.error(f"update {getattr(update, 'update_id', '')}: {err}")
+            finally:
+                self.latency_max = max(self.latency_max, time.monotonic() - received)
+                queue.task_done()
+
+    def depth(self) -> int:
+        return sum(queue.qsize() for queue in self._queues)
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers_count,
+            "depth": self.depth(),
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "processed": self.processed,
+            "failed": self.failed,
+            "latency_max": round(self.latency_max, 3),
+        }
@@ -65,9 +65,123 @@ class JWTConfiguration(BaseModel):
 
 
 class RateLimit(BaseModel):
-    is_enable: bool = False
-    second: int = 10
-    minute: int = 100
+    # outbound Telegram messages (all the chats): Telegram allows about 30 per second
+    is_enable: bool = True
+    second: int = 25
+    minute: int = 1200
+    chat_second: float = 1.0  # messages per second to one chat
+    chat_burst: int = 3
+    retries: int = 3  # repeats after Telegram "retry after"
+
+
+class HttpConfig(BaseModel):
+    timeout: int = 20
+    retries: int = 3
+    pool_size: int = 100
+    per_host_limit: int = 10
+    keepalive_timeout: int = 30
+    user_agent: str = "My User Agent 1.0"
+
+
+class BrowserConfig(BaseModel):
+    browser: str = "firefox"  # firefox | chrome
+    pool_size: int = 2
+    max_pages: int = 50  # the browser is restarted after `max_pages` pages
+    wait_sec: int = 20
+
+
+class FetchRouterConfig(BaseModel):
+    is_browser_enable: bool = True  # escalate to the browser pool, when the plain HTTP page has no forecast
+    reprobe_every: int = 20  # retry plain HTTP for a "browser" city/host after so many requests
+    # the host is "browser" first when `host_browser_share` of its last `host_window` HTTP fetches failed
+    host_window: int = 50
+    host_min_samples: int = 20
+    host_browser_share: float = 0.8
+
+
+class CacheConfig(BaseModel):
+    ttl_sec: int = 900
+    max_size: int = 500
+    store_ttl_sec: int = 3600  # freshness window of the forecasts saved in the DB
+    workbook_max_size: int = 100  # xlsx files of the forecasts kept in memory
+
+
+class UserPrefsCacheConfig(BaseModel):
+    # preferences of the users (menu_scale) read by every keyboard; updated by the writes of the user
+    ttl_sec: int = 3600
+    max_size: int = 10000
+    layout_max_size: int = 1024  # keyboard layouts by (button texts, menu_scale)
+
+
+class MediaCacheConfig(BaseModel):
+    # Telegram file_id of the sent photos / documents by the content hash - sent again without the upload
+    ttl_sec: int = 86400
+    max_size: int = 1000
+
+
+class PrefetchConfig(BaseModel):
+    is_enable: bool = True
+    interval_sec: int = 600
+    top_cities: int = 20
+    window_hours: int = 24
+    concurrency: int = 4
+
+
+class DialogStateConfig(BaseModel):
+    shards: int = 16
+    max_size: int = 10000  # chats with the live dialog in memory
+    idle_ttl_sec: int = 1800  # the dialog is released after so many seconds without messages
+
+
+class DebounceConfig(BaseModel):
+    window_sec: float = 1.0  # the messages of a user within the window are joined (0 - no joining)
+    max_wait_sec: float = 3.0  # the joined text is handled not later than so many seconds after the first message
+
+
+class PollingConfig(BaseModel):
+    # restart of the failed polling: exponential backoff with jitter (aiogram `BackoffConfig`)
+    backoff_min_sec: float = 1.0
+    backoff_max_sec: float = 60.0
+    backoff_factor: float = 2.0
+    backoff_jitter: float = 0.1
+    stable_sec: float = 60.0  # the backoff is reset after the polling has worked so long
+
+
+class WebhookConfig(BaseModel):
+    is_enable: bool = False  # webhook instead of the long polling (needs `uvicorn`, extra "webhook")
+    url: str = ""  # public https address of the server, `path` is added to it
+    path: str = "/telegram/webhook"
+    host: str = "0.0.0.0"
+    port: int = 8080
+    secret_token: str = ""
+    workers: int = 16  # updates of the different chats are processed in parallel, of one chat - in order
+    queue_size: int = 1000  # updates waiting for the workers, above - HTTP 503 (Telegram sends them again)
+
+
+class BatchConfig(BaseModel):
+    max_cities: int = 20
+    concurrency: int = 4
+
+
+class JobQueueConfig(BaseModel):
+    # background jobs of the chats (the forecast file): worker tasks, the CPU-bound parts go to the executor
+    workers: int = 4
+    queue_size: int = 100
+    history: int = 1000  # jobs kept for the status command
+
+
+class ExecutorConfig(BaseModel):
+    # process pool for the CPU-bound stages (parsing of the pages, xlsx); False - they run in the event loop
+    is_enable: bool = True
+    workers: int = 0  # 0 - the number of the CPU cores
+    start_method: str = "forkserver"  # the bot has threads (SQLite pool, browser): "fork" is not safe
+    warm_modules: list[str] = ["lxml.html", "pandas", "xlsxwriter", "app.adapters.yandex", "app.utils.utils"]
+
+
+class CityKeyboardConfig(BaseModel):
+    # the City directory is shown by pages: the regions (or the first letters), then the cities of one of them
+    page_size: int = 30
+    buckets_page_size: int = 40
 
 
 class Configuration(BaseModel):
@@ -76,9 +190,26 @@ class Configuration(BaseModel):
     project_environment: str
 
     sqlite_db: str = str(PROJ_ROOT / "app/db/weather_db.db")
+    sqlite_readers: int = 4
 
     telegram_token: str
     proxy: str = ""
+    http: HttpConfig = HttpConfig()
+    browser: BrowserConfig = BrowserConfig()
+    fetch_router: FetchRouterConfig = FetchRouterConfig()
+    forecast_cache: CacheConfig = CacheConfig()
+    prefetch: PrefetchConfig = PrefetchConfig()
+    weather_batch: BatchConfig = BatchConfig()
+    city_keyboard: CityKeyboardConfig = CityKeyboardConfig()
+    job_queue: JobQueueConfig = JobQueueConfig()
+    executor: ExecutorConfig = ExecutorConfig()
+    dialog_state: DialogStateConfig = DialogStateConfig()
+    debounce: DebounceConfig = DebounceConfig()
+    polling: PollingConfig = PollingConfig()
+    webhook: WebhookConfig = WebhookConfig()
+    rate_limit: RateLimit = RateLimit()
+    media_cache: MediaCacheConfig = MediaCacheConfig()
+    user_prefs_cache: UserPrefsCacheConfig = UserPrefsCacheConfig()
 
     logging: LoggingConfig
 
@@ -0,0 +1,72 @@
+"""
+Command routing time: linear scans of `command_dict` (previous implementation) vs the precompiled routing table
+
+    python -m app.test.bench_command_router
+"""
+import re
+import timeit
+
+from app.services.dialog_flow import DialogFlow
+
+TEXTS = [
+    "flow_weather_get moscow",
+    "🌦 Прогноз погоды",
+    "/start",
+    "Основное меню",
+    "🔚 Выйти",
+    "батч",
+    "Москва",
+    "какой-то произвольный текст пользователя",
+]
+
+
+class LegacyRouter:
+    command_dict = DialogFlow.command_dict
+
+    def add_img_in_command(self, command: str) -> str:
+        img = ""
+        for key, value in self.command_dict.items():
+            if command.lower() in value["list"] + [key]:
+                try:
+                    img = value["img"] + " "
+                except:
+                    pass
+                break
+        return img + command
+
+    def get_command_from_str(self, arg_str: str) -> tuple:
+        def _is_command_in_dict(command: str) -> bool:
+            for key, value in self.command_dict.items():
+                if command in list(map(str.lower, (value["list"] + [key]))):
+                    return True
+            return False
+
+        img_list = [self.command_dict[el]["img"] for el in self.command_dict if "img" in self.command_dict[el]]
+        command = re.sub(r"|".join(map(re.escape, ["/"] + img_list)), "", arg_str.lower()).strip()
+        if _is_command_in_dict(command):
+            return command, None
+        if len(command.split(" ")) < 2:
+            return None, None
+        index = command.rfind(" ")
+        command, param = command[:index], command[index + 1:]
+        return (command, param) if _is_command_in_dict(command) else (None, None)
+
+
+def main():
+    legacy, router = LegacyRouter(), DialogFlow(weather_parser=None)
+    for text in TEXTS:
+        assert legacy.get_command_from_str(text) == router.get_command_from_str(text), text
+        assert legacy.add_img_in_command(text) == router.add_img_in_command(text), text
+    print(f"{len(TEXTS)} texts, results are equal")
+
+    for name, obj in (("linear scan", legacy), ("routing table", router)):
+        number = 2000
+        seconds = min(timeit.repeat(
+            lambda: [(obj.get_command_from_str(text), obj.add_img_in_command(text)) for text in TEXTS],
+            number=number, repeat=3,
+        )) / number / len(TEXTS)
+        print(f"{name:>14}: {seconds * 1e6:8.2f} µs/text")
+
+
+if __name__ == "__main__":
+    main()
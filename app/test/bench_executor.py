@@ -0,0 +1,62 @@
+"""
+Concurrent forecast pages: parsing + xlsx in the event loop vs the process pool (`CpuExecutor`)
+
+    python -m app.test.bench_executor [requests] [workers]
+
+The event loop lag (p50 / p99 / max) is what the other chats wait for their replies during the spike.
+"""
+import asyncio
+import statistics
+import sys
+import time
+
+from app.adapters.yandex import parse_forecast_page
+from app.settings import ExecutorConfig
+from app.test.bench_yandex_parser import synthetic_page
+from app.utils.executor import CpuExecutor
+from app.utils.utils import table_bytes
+
+
+def parse_and_write(content: str) -> bytes:
+    result_df, error_msg = parse_forecast_page(content)
+    return table_bytes({"city": result_df}, "xlsx")
+
+
+async def loop_lag(lags: list[float], stop: asyncio.Event, interval: float = 0.005):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - start - interval)
+
+
+async def spike(executor: CpuExecutor, content: str, requests: int) -> tuple[float, list[float]]:
+    await executor.warm()
+    lags, stop = [], asyncio.Event()
+    ticker = asyncio.create_task(loop_lag(lags, stop))
+    start = time.perf_counter()
+    results = await asyncio.gather(*[executor.run(parse_and_write, content) for _ in range(requests)])
+    seconds = time.perf_counter() - start
+    stop.set()
+    await ticker
+    assert all(results)
+    return seconds, lags
+
+
+def main(requests: str = "200", workers: str = "0"):
+    content = synthetic_page(days=10, noise=3000)
+    print(f"page: {len(content)} chars, requests: {requests}")
+    for name, config in (
+        ("event loop", ExecutorConfig(is_enable=False)),
+        ("process pool", ExecutorConfig(workers=int(workers))),
+    ):
+        executor = CpuExecutor(config)
+        seconds, lags = asyncio.run(spike(executor, content, int(requests)))
+        executor.close()
+        lags = sorted(lags) or [0.0]
+        print(f"{name:>12} ({executor.stats()['workers']} workers): {int(requests) / seconds:7.1f} pages/sec, "
+              f"loop lag p50 {statistics.median(lags) * 1000:6.1f} ms, "
+              f"p99 {lags[int(len(lags) * 0.99)] * 1000:6.1f} ms, max {lags[-1] * 1000:6.1f} ms")
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
@@ -0,0 +1,113 @@
+"""
+Parse time per page: BeautifulSoup (`html.parser`, previous implementation) vs lxml single-pass parser
+
+    python -m app.test.bench_yandex_parser [saved_page.html]
+
+Without an argument a synthetic page with the Yandex forecast markup is used.
+"""
+import re
+import sys
+import timeit
+
+import pandas as pd
+from bs4 import BeautifulSoup
+from pandas import DataFrame
+
+from app.adapters.yandex import forecast_frame, parse_forecast_page
+from app.utils.utils import clean_html
+
+
+def parse_forecast_page_bs4(content: str, page_address: str = "") -> tuple[DataFrame, str]:
+    soup = BeautifulSoup(content, "html.parser")
+    forecasts = soup.find_all(class_=re.compile("AppForecastDay_container", re.I))
+    error_msg = ""
+    result_df = DataFrame()
+    for index, forecast in enumerate(forecasts):
+        if index >= 7:
+            break
+        try:
+            date_day_month = clean_html(
+                forecast.find(class_=re.compile("AppForecastDayHeader_dayTitle", re.I)).contents[0]
+            )
+            magnetic_field = ""
+            fields = forecast.find_all(class_=re.compile("AppForecastDayDuration_item", re.I))
+            for el in fields:
+                if el.text.find("Магнитное поле") >= 0:
+                    magnetic_field = el.contents[1].text
+                    break
+            part_day = [el.text for el in forecast.find_all(style=re.compile("-part", re.I))]
+            fields = forecast.find_all(class_=re.compile("AppForecastDayPart_temp", re.I))
+            temperature = [int(el.contents[0][:-1]) for el in fields]
+            temperature_avg = sum(temperature[:-1]) / len(temperature[:-1])
+            pressure = [int(el.text) for el in forecast.find_all(style=re.compile("-press", re.I))]
+            min_, max_ = min(pressure), max(pressure)
+            pressure_text = "" if max_ - min_ < 5 else (
+                "ожидается резкое увеличение атмосферного давления" if pressure.index(min_) < pressure.index(max_)
+                else "ожидается резкое падение атмосферного давления")
+            wetness = [el.text for el in forecast.find_all(style=re.compile("-hum", re.I))]
+            event = [el.text for el in forecast.find_all(style=re.compile("-text", re.I))]
+            result_df = pd.concat([
+                result_df,
+                DataFrame({
+                    "Дата": date_day_month,
+                    "Время суток": part_day,
+                    "Температура": temperature,
+                    "Средняя температура за световой день": temperature_avg,
+                    "Давление": pressure,
+                    "Давление (комментарий)": pressure_text,
+                    "Влажность": wetness,
+                    "Погодное явление": event,
+                    "Магнитное поле": magnetic_field,
+                })],
+                ignore_index=True, sort=False)
+        except Exception as err:
+            error_msg += f"{err}\n"
+    if result_df.empty:
+        error_msg = f"Ошибка парсинга сайта: `{page_address}`"
+    return result_df, error_msg
+
+
+def synthetic_page(days: int = 10, noise: int = 300) -> str:
+    parts = ["утро", "день", "вечер", "ночь"]
+    blocks = []
+    for day in range(days):
+        cells = "".join(
+            f'<div style="grid-area:{num}-part">{part}</div>'
+            f'<div class="AppForecastDayPart_temp__x1">+{day + num}°</div>'
+            f'<div style="grid-area:{num}-press">{740 + day + num * 2}</div>'
+            f'<div style="grid-area:{num}-hum">{60 + num}%</div>'
+            f'<div style="grid-area:{num}-text">Облачно с прояснениями</div>'
+            for num, part in enumerate(parts)
+        )
+        blocks.append(
+            f'<article class="AppForecastDay_container__AnH4J" data-day="day_{day}">'
+            f'<h3 class="AppForecastDayHeader_dayTitle__23ecF">{18 + day} октября<span>, сб</span></h3>'
+            f'<ul><li class="AppForecastDayDuration_item__a1"><span>Восход</span><span>07:12</span></li>'
+            f'<li class="AppForecastDayDuration_item__a1"><span>Магнитное поле</span><span>Нормальное</span></li></ul>'
+            f'<div class="AppForecastDayPart_grid">{cells}</div></article>'
+        )
+    filler = "".join(f'<div class="Noise_{num}"><a href="#{num}">ссылка {num}</a></div>' for num in range(noise))
+    return f"<html><head><title>Погода</title></head><body>{filler}{''.join(blocks)}{filler}</body></html>"
+
+
+def main(path: str = None):
+    if path:
+        with open(path, encoding="utf-8") as in_file:
+            content = in_file.read()
+    else:
+        content = synthetic_page()
+
+    df_bs4, _ = parse_forecast_page_bs4(content)
+    df_lxml, _ = parse_forecast_page(content)
+    # the previous implementation kept "Дата" as a text and did not set the column types
+    pd.testing.assert_frame_equal(forecast_frame(df_bs4.assign(**{"Дата": None})).drop(columns="Дата"), df_lxml.drop(columns="Дата"))
+    print(f"page: {len(content)} chars, rows: {df_lxml.shape[0]} (results are equal)")
+
+    for name, parser in (("bs4 html.parser", parse_forecast_page_bs4), ("lxml single-pass", parse_forecast_page)):
+        number = 20
+        seconds = min(timeit.repeat(lambda: parser(content), number=number, repeat=3)) / number
+        print(f"{name:>18}: {seconds * 1000:8.2f} ms/page")
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
@@ -0,0 +1,43 @@
+"""
+AsyncTTLCache.get_or_load: the waiters coalesced on a loader that is cancelled load the key again
+
+    python -m app.test.check_cache
+"""
+import asyncio
+
+from app.utils.cache import AsyncTTLCache
+
+
+async def main():
+    cache = AsyncTTLCache(ttl=60, max_size=10)
+    calls = []
+
+    async def loader(key):
+        calls.append(key)
+        await asyncio.sleep(0.05)
+        return key.upper()
+
+    leader = asyncio.create_task(cache.get_or_load("moscow", loader, "moscow"))
+    await asyncio.sleep(0)
+    waiters = [asyncio.create_task(cache.get_or_load("moscow", loader, "moscow")) for _ in range(3)]
+    await asyncio.sleep(0.01)
+    leader.cancel()
+    assert (await asyncio.gather(leader, return_exceptions=True))[0].__class__ is asyncio.CancelledError
+    assert await asyncio.gather(*waiters) == ["MOSCOW"] * 3
+    assert calls == ["moscow", "moscow"], calls  # one retry for all the waiters
+    assert cache.get("moscow") == "MOSCOW"
+
+    # a loader error is passed to the waiters, nothing is cached
+    async def failing(key):
+        await asyncio.sleep(0.01)
+        raise ValueError(key)
+
+    results = await asyncio.gather(*(cache.get_or_load("kazan", failing, "kazan") for _ in range(3)),
+                                   return_exceptions=True)
+    assert all(isinstance(result, ValueError) for result in results), results
+    assert "kazan" not in cache
+    print(f"cache: ok {cache.stats()}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,59 @@
+"""
+CityIndex on the City directory (city_spr.csv): the names with typos / in latin letters, the cost of a miss
+
+    python -m app.test.check_city_index
+"""
+import csv
+import time
+from pathlib import Path
+
+from app.utils.city_index import CityIndex
+
+TYPOS = {
+    "масква": "Москва",  # substitution
+    "мсоква": "Москва",  # transposition
+    "моска": "Москва",  # deletion
+    "питербург": "Санкт-Петербург",  # a word of the name
+    "moskva": "Москва",  # the russian name in latin letters
+    "moscow": "Москва",
+    "казнь": "Казань",
+    "омкс": "Омск",
+    "екатиринбург": "Екатеринбург",
+    "нижний новгрод": "Нижний Новгород",
+}
+MISSES = ("zzzz", "абвгдежз", "qwertyuiop")
+
+
+def load_index() -> CityIndex:
+    with open(Path(__file__).with_name("city_spr.csv"), encoding="utf-8") as file:
+        rows = list(csv.DictReader(file))
+    index = CityIndex()
+    index.build([{"id": num, "name_ru": row["name-ru"], "name_en": row["dockey"]} for num, row in enumerate(rows)])
+    return index
+
+
+def per_search(index: CityIndex, query: str, repeat: int = 200) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        index.search(query, limit=5)
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    index = load_index()
+    for query, expected in TYPOS.items():
+        found = [city["name_ru"] for city in index.search(query, limit=5)]
+        assert found and found[0] == expected, (query, found)
+    # the exact and prefix matches are ranked above the typos
+    assert [city["name_ru"] for city in index.search("омск", limit=3)][0] == "Омск"
+    assert index.search("уфа", limit=1)[0]["name_ru"] == "Уфа"
+    for query in MISSES:
+        assert index.search(query) == [], query
+    hit = per_search(index, "москва")
+    miss = max(per_search(index, query) for query in MISSES)
+    assert miss < 5 * hit + 100e-6, (hit, miss)  # no scan of the whole directory on a miss
+    print(f"city index: ok, hit {hit * 1e6:.1f} µs, miss {miss * 1e6:.1f} µs")
+
+
+if __name__ == "__main__":
+    main()
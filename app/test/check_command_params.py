@@ -0,0 +1,72 @@
+"""
+Commands with a param of several words: the longest command taking a param is the prefix, the rest of the text
+is the param; the other texts are not commands
+
+    python -m app.test.check_command_params
+"""
+import asyncio
+
+from app.services.dialog_flow import DialogFlow
+from app.settings import ExecutorConfig
+from app.utils.city_index import CityIndex
+from app.utils.executor import cpu_executor
+
+CITIES = [
+    {"id": 1, "name_ru": "москва", "name_en": "moscow"},
+    {"id": 2, "name_ru": "казань", "name_en": "kazan"},
+    {"id": 3, "name_ru": "нижний новгород", "name_en": "nizhny-novgorod"},
+    {"id": 4, "name_ru": "великий новгород", "name_en": "veliky-novgorod"},
+]
+
+
+class FakeWeatherParser:
+    def __init__(self):
+        self.city_index = CityIndex()
+        self.city_index.build(CITIES)
+        self.batch_cities = None
+
+    async def city_find(self, name: str, limit: int = 20) -> list[dict]:
+        return self.city_index.search(name, limit=limit) or None
+
+    async def user_city_get(self, user_id: int, limit: int = 10) -> list[dict]:
+        return [CITIES[0]]  # the user has the saved cities
+
+    async def weather_batch_get(self, user_id: int, cities: list[str]) -> dict:
+        self.batch_cities = cities
+        return {city: {"is_error": True, "message": "offline"} for city in cities}
+
+
+async def batch(dialog_flow: DialogFlow, text: str) -> list[str]:
+    command, param = dialog_flow.get_command_from_str(text)
+    assert dialog_flow.command_flow[command] == "flow_weather_batch", (text, command)
+    generator = dialog_flow.flow_weather_batch(chat_id=1, username="user", param=param)
+    await generator.__anext__()
+    await generator.aclose()
+    return dialog_flow.weather_parser.batch_cities
+
+
+async def main():
+    cpu_executor.config = ExecutorConfig(is_enable=False)
+    dialog_flow = DialogFlow(weather_parser=FakeWeatherParser())
+
+    assert dialog_flow.get_command_from_str("batch москва, казань") == ("batch", "москва, казань")
+    assert dialog_flow.get_command_from_str("🗂 Прогноз по моим городам нижний новгород, казань") == \
+        ("прогноз по моим городам", "нижний новгород, казань")
+    assert dialog_flow.get_command_from_str("прогноз по городам") == ("прогноз по городам", None)
+    assert dialog_flow.get_command_from_str("какой-то произвольный текст") == (None, None)
+    assert dialog_flow.get_command_from_str("логи csv") == ("логи", "csv")
+    # the free text starting with a command not taking a param is not a command
+    assert dialog_flow.get_command_from_str("Привет меня зовут Иван") == (None, None)
+    assert dialog_flow.get_command_from_str("меню на завтра") == (None, None)
+    assert dialog_flow.get_command_from_str("Привет") == ("привет", None)
+
+    # the param wins over the saved cities of the user
+    assert await batch(dialog_flow, "batch москва, казань") == ["moscow", "kazan"]
+    assert await batch(dialog_flow, "прогноз по моим городам нижний новгород, великий новгород; казань") == \
+        ["nizhny-novgorod", "veliky-novgorod", "kazan"]
+    assert await batch(dialog_flow, "прогноз по моим городам") == ["moscow"]
+    print("command params: ok")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
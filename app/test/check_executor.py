@@ -0,0 +1,52 @@
+"""
+CpuExecutor: a worker process died - the call is retried once in the new pool, never in the event loop
+
+    python -m app.test.check_executor
+"""
+import asyncio
+import os
+import signal
+import tempfile
+from concurrent.futures.process import BrokenProcessPool
+
+from app.settings import ExecutorConfig
+from app.utils.executor import CpuExecutor
+
+
+def die(parent: int) -> int:
+    """The worker is killed (in the event loop process the function returns its pid)"""
+    if os.getpid() != parent:
+        os.kill(os.getpid(), signal.SIGKILL)
+    return os.getpid()
+
+
+def die_once(marker: str) -> int:
+    """The first call kills its worker, the retry returns the pid of the new worker"""
+    if not os.path.exists(marker):
+        open(marker, "w").close()
+        os.kill(os.getpid(), signal.SIGKILL)
+    return os.getpid()
+
+
+async def main():
+    parent = os.getpid()
+    executor = CpuExecutor(ExecutorConfig(workers=2, warm_modules=[]))
+    await executor.warm()
+
+    with tempfile.TemporaryDirectory() as folder:
+        assert await executor.run(die_once, os.path.join(folder, "marker")) != parent
+    assert executor.stats()["restarts"] == 1, executor.stats()
+
+    # the retry fails too: the error is raised, the call is not done in the event loop
+    results = await asyncio.gather(executor.run(die, parent), executor.run(die, parent), return_exceptions=True)
+    assert all(isinstance(result, BrokenProcessPool) for result in results), results
+    assert executor.stats()["running"] == 0, executor.stats()
+
+    # the next calls are served by the new pool
+    assert await executor.run(die_once, os.devnull) != parent
+    executor.close()
+    print("executor: ok", executor.stats())
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,65 @@
+"""
+FetchRouter: one city needing the browser does not move the other cities (and the host) to the browser
+
+    python -m app.test.check_fetch_router
+"""
+import asyncio
+
+from app.adapters.fetch_router import FetchRouter
+from app.settings import FetchRouterConfig
+
+FORECAST = '<div class="AppForecastDay_container">...</div>'
+BROWSER_CITIES = {"special"}  # the forecast of these cities is rendered by the browser only
+
+
+class FakeFetchers:
+    def __init__(self):
+        self.calls = {"http": 0, "browser": 0}
+        self.http_down = False
+
+    async def http(self, url: str) -> str:
+        self.calls["http"] += 1
+        if self.http_down:
+            raise TimeoutError("timeout")
+        return "<html>captcha</html>" if url.rsplit("/", 1)[-1] in BROWSER_CITIES else FORECAST
+
+    async def browser(self, url: str) -> str:
+        self.calls["browser"] += 1
+        return FORECAST
+
+
+async def main():
+    config = FetchRouterConfig(host_window=10, host_min_samples=5, host_browser_share=0.8)
+    router, fake = FetchRouter(config), FakeFetchers()
+    router.fetchers = {router.HTTP: fake.http, router.BROWSER: fake.browser}
+    url = "https://yandex.ru/pogoda/ru/{}"
+
+    # the browser-only city is escalated and remembered, the other cities stay on HTTP
+    assert (await router.fetch(url.format("special"), city="special"))[1] == router.BROWSER
+    for city in ("moscow", "kazan", "omsk"):
+        assert (await router.fetch(url.format(city), city=city))[1] == router.HTTP, city
+    assert (await router.fetch(url.format("special"), city="special"))[1] == router.BROWSER
+    assert fake.calls == {"http": 4, "browser": 2}, fake.calls  # the second "special" goes to the browser at once
+    assert router.stats()["browser_hosts"] == [], router.stats()
+
+    # an HTTP timeout fixed by the browser does not pin the city to the browser
+    fake.http_down = True
+    assert (await router.fetch(url.format("perm"), city="perm"))[1] == router.BROWSER
+    assert router.preferred.get("perm") is None
+    assert router.stats()["browser_hosts"] == [], router.stats()
+
+    # most of the recent HTTP fetches of the host failed: the new cities start with the browser
+    for num in range(10):
+        await router.fetch(url.format(f"city{num}"), city=f"city{num}")
+    assert router.stats()["browser_hosts"] == ["yandex.ru"], router.stats()
+    fake.calls = {"http": 0, "browser": 0}
+    await router.fetch(url.format("new"), city="new")
+    assert fake.calls == {"http": 0, "browser": 1}, fake.calls
+    # the cities known to work by HTTP are not affected
+    fake.http_down = False
+    assert (await router.fetch(url.format("moscow"), city="moscow"))[1] == router.HTTP
+    print("fetch router: ok", router.stats())
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
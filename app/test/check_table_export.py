@@ -0,0 +1,41 @@
+"""
+TableExporter: parquet / arrow export of the chunks whose first chunk has an all-NULL column
+
+    python -m app.test.check_table_export
+"""
+import io
+
+import pandas as pd
+import pyarrow
+import pyarrow.parquet
+
+from app.adapters.db_adapter import WeatherParser
+from app.utils.utils import export_writer
+
+
+def log_chunks() -> list[pd.DataFrame]:
+    columns = WeatherParser.log_field
+    return [
+        pd.DataFrame([(1, 10, "2026-01-01 10:00:00", "moscow", False, None)], columns=columns),
+        pd.DataFrame([(2, None, "2026-01-01 11:00:00", "kazan", True, "timeout")], columns=columns),
+    ]
+
+
+def read(output: io.BytesIO, param: str) -> pd.DataFrame:
+    output.seek(0)
+    if param == "parquet":
+        return pyarrow.parquet.read_table(output).to_pandas()
+    return pyarrow.ipc.open_stream(output).read_all().to_pandas()
+
+
+def main():
+    for param in ("parquet", "arrow"):
+        for schema in (WeatherParser.log_export_schema, None):
+            df = read(export_writer(log_chunks(), param=param, schema=schema), param)
+            assert df["message"].tolist() == [None, "timeout"], df
+            assert df.shape == (2, len(WeatherParser.log_field))
+    print("table export: ok")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+xlsx: `xlsx_fast_writer` against the `ExcelWriter` path of `table_writer`, cell by cell
+(value, type, number format) and the column widths; the workbooks are read by openpyxl.
+The widths computed from the dtypes (`text_len`) are checked against `astype(str)` of every value.
+
+    python -m app.test.check_xlsx_parity
+"""
+import datetime
+import math
+from io import BytesIO
+
+import openpyxl
+import pandas as pd
+
+from app.test.bench_yandex_parser import synthetic_page
+from app.adapters.yandex import parse_forecast_page
+from app.utils import utils
+
+
+def edge_frame() -> pd.DataFrame:
+    return pd.DataFrame({
+        "Целые": [1, 12, -3, 40000],
+        "Дробные": [1.5, math.nan, math.inf, -math.inf],
+        "Числа текстом": ["12", "3.5", "-7", "1e3"],
+        "Особые тексты": ["nan", "inf", "1_000", " 12 "],
+        "Смешанные": [1, "два", None, 4.0],
+        "Флаги": [True, False, True, False],
+        "Флаги с пустыми": [True, None, False, None],
+        "Текст": ["Москва", "", None, "=1+1"],
+        "Дата": pd.to_datetime(["2026-10-18", "2026-10-19", None, "2026-10-21"]),
+        "Время": pd.to_datetime(["2026-10-18 10:30:00", None, "2026-10-20 00:00:00", "2026-10-21 23:59:59"]),
+        "Даты объекты": [datetime.date(2026, 10, 18), None, datetime.date(2026, 1, 1), datetime.date(2026, 2, 2)],
+        "Длительность": [pd.Timedelta(hours=36), pd.Timedelta(0), None, pd.Timedelta(days=2)],
+    })
+
+
+def dtype_frame() -> pd.DataFrame:
+    return pd.DataFrame({
+        "Отрицательные": [-12345, 7, 0],
+        "Без знака": pd.Series([1, 200, 3], dtype="uint16"),
+        "Категории": pd.Categorical(["утро", None, "день"], categories=["утро", "день", "вечер-ночь"]),
+        "Категории числа": pd.Categorical(["12", "3", "12"]),
+        "Флаги": [True, True, True],
+        "Секунды": pd.to_datetime(["2026-10-18 10:30:15", None, "2026-10-18 00:00:00"]),
+        "Доли секунд": pd.to_datetime(["2026-10-18 10:30:15.5", None, "2026-10-18 00:00:00.0"]),
+        "Пустые даты": pd.to_datetime(pd.Series([None, None, None], dtype="datetime64[ns]")),
+        "Минус ноль": [0.0, -1.25, 1e-20],
+    })
+
+
+def check_text_len(df: pd.DataFrame):
+    for column in df.columns:
+        expected = int(df[column].astype(str).str.len().max())
+        assert utils.text_len(df[column]) == expected, (column, utils.text_len(df[column]), expected)
+
+
+def cells(content: bytes) -> dict:
+    workbook = openpyxl.load_workbook(BytesIO(content))
+    result = {}
+    for worksheet in workbook.worksheets:
+        result[worksheet.title, "freeze"] = worksheet.freeze_panes
+        for letter, dimension in worksheet.column_dimensions.items():
+            result[worksheet.title, letter] = dimension.width
+        for row in worksheet.iter_rows():
+            for cell in row:
+                if cell.value is not None:
+                    result[worksheet.title, cell.coordinate] = (cell.value, cell.data_type, cell.number_format)
+    return result
+
+
+def both(dataframes: dict, baseline_dataframes: dict = None) -> tuple[dict, dict]:
+    fast = cells(utils.table_bytes(dataframes, "xlsx"))
+    max_rows, utils.XLSX_FAST_MAX_ROWS = utils.XLSX_FAST_MAX_ROWS, -1  # the ExcelWriter path
+    try:
+        baseline = cells(utils.table_bytes(baseline_dataframes or dataframes, "xlsx"))
+    finally:
+        utils.XLSX_FAST_MAX_ROWS = max_rows
+    return fast, baseline
+
+
+def compare(name: str, dataframes: dict, baseline_dataframes: dict = None):
+    fast, baseline = both(dataframes, baseline_dataframes)
+    diff = {key: (fast.get(key), baseline.get(key)) for key in fast.keys() | baseline.keys()
+            if fast.get(key) != baseline.get(key)}
+    assert not diff, f"{name}: {diff}"
+    print(f"{name}: {len(baseline)} cells / widths are equal")
+
+
+def main():
+    forecast_df, error_msg = parse_forecast_page(synthetic_page())
+    for df in (forecast_df, edge_frame(), dtype_frame()):
+        check_text_len(df)
+        check_text_len(utils.df_convert_number_to_number(df))
+    compare("forecast", {"moscow": forecast_df})
+    # the typed forecast skips `df_convert_number_to_number`: the same cells as with the conversion
+    untyped_df = forecast_df.copy()
+    untyped_df.attrs.clear()
+    compare("forecast typed / converted", {"moscow": forecast_df}, {"moscow": untyped_df})
+    compare("edge values", {"edge": edge_frame()})
+    compare("dtypes", {"dtypes": dtype_frame()})
+    compare("several sheets", {"Сводка": edge_frame().iloc[:2], None: forecast_df, "empty": pd.DataFrame({"a": []})})
+
+
+if __name__ == "__main__":
+    main()
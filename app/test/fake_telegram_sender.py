@@ -0,0 +1,128 @@
+"""
+Fake Telegram: sends text updates of many chats to the webhook and checks the per-chat order
+
+    python -m app.test.fake_telegram_sender http://127.0.0.1:8080/telegram/webhook [chats] [messages] [secret]
+
+Without the address the webhook application is created in-process (`create_webhook_app`) with a recording
+dispatcher, so the queue throughput and the order of the updates of every chat are checked without the bot.
+"""
+import asyncio
+import itertools
+import json
+import random
+import sys
+import time
+import types
+
+import aiohttp
+
+from app.adapters.webhook import create_webhook_app
+from app.settings import WebhookConfig
+
+update_ids = itertools.count(1)
+
+
+def fake_update(chat_id: int, text: str) -> dict:
+    return {
+        "update_id": next(update_ids),
+        "message": {
+            "message_id": next(update_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private", "first_name": f"user {chat_id}"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": f"user {chat_id}"},
+            "text": text,
+        },
+    }
+
+
+async def send_http(url: str, chats: int, messages: int, secret: str = ""):
+    headers = {"X-Telegram-Bot-Api-Secret-Token": secret} if secret else {}
+    statuses = {}
+    async with aiohttp.ClientSession(headers=headers) as session:
+
+        async def _chat(chat_id: int):
+            for num in range(messages):
+                update = fake_update(chat_id, f"message {num}")
+                while True:
+                    async with session.post(url, json=update) as response:
+                        statuses[response.status] = statuses.get(response.status, 0) + 1
+                    if response.status != 503:
+                        break
+                    await asyncio.sleep(0.05)
+
+        start = time.monotonic()
+        await asyncio.gather(*[_chat(chat_id) for chat_id in range(1, chats + 1)])
+    seconds = time.monotonic() - start
+    print(f"{chats * messages} updates in {seconds:.2f} sec ({chats * messages / seconds:.0f}/sec), statuses: {statuses}")
+
+
+class RecordingDispatcher:
+    """Records (chat, message number); the handling takes random 0-5 ms"""
+
+    def __init__(self):
+        self.received: dict[int, list[int]] = {}
+
+    async def feed_update(self, bot, update):
+        await asyncio.sleep(random.random() / 200)
+        message = update.message
+        self.received.setdefault(message.chat.id, []).append(int(message.text.split()[-1]))
+
+
+async def asgi_post(app, path: str, body: dict) -> int:
+    request = [{"type": "http.request", "body": json.dumps(body).encode(), "more_body": False}]
+    sent = []
+
+    async def receive():
+        return request.pop(0) if request else {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+
+    await app({
+        "type": "http", "method": "POST", "path": path, "query_string": b"", "root_path": "",
+        "headers": [(b"content-type", b"application/json")], "http_version": "1.1", "scheme": "http",
+        "server": ("fake", 80), "client": ("telegram", 1),
+    }, receive, send)
+    return sent[0]["status"]
+
+
+async def send_in_process(chats: int, messages: int):
+    config = WebhookConfig(is_enable=True)
+    telegram = types.SimpleNamespace(dispatcher=RecordingDispatcher(), bot=None, health={})
+    app = create_webhook_app(telegram, config)
+    updates = app.state.updates
+    updates.start()
+    statuses = {}
+
+    async def _chat(chat_id: int):
+        # as Telegram: the next update of the chat after the previous one is accepted, 503 - sent again
+        for num in range(messages):
+            update = fake_update(chat_id, f"message {num}")
+            while True:
+                status = await asgi_post(app, config.path, update)
+                statuses[status] = statuses.get(status, 0) + 1
+                if status == 200:
+                    break
+                await asyncio.sleep(0.05)
+
+    start = time.monotonic()
+    await asyncio.gather(*[_chat(chat_id) for chat_id in range(1, chats + 1)])
+    await updates.stop(timeout=60)
+    seconds = time.monotonic() - start
+
+    received = telegram.dispatcher.received
+    is_ordered = all(numbers == sorted(numbers) for numbers in received.values())
+    print(f"{chats * messages} updates in {seconds:.2f} sec ({chats * messages / seconds:.0f}/sec), "
+          f"statuses: {statuses}, per-chat order kept: {is_ordered}")
+    print(updates.stats())
+
+
+def main(url: str = "", chats: str = "200", messages: str = "20", secret: str = ""):
+    if url:
+        asyncio.run(send_http(url, int(chats), int(messages), secret))
+    else:
+        asyncio.run(send_in_process(int(chats), int(messages)))
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
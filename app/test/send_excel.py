@@ -11,12 +11,21 @@ from app.utils.utils import table_writer, run_async
 
 def create_city_spr():
         df = pd.read_csv("city_spr.csv")
-        df.rename(columns={"name-en": "name_en", "name-ru": "name_ru"}, inplace=True)
+        df.rename(columns={"name-en": "name_en", "name-ru": "name_ru", "Federal subject": "region"}, inplace=True)
         df["name_ru"] = df["name_ru"].str.lower()
         df["name_en"] = df["name_en"].str.replace(" ", "-").str.lower()
         df["id"] = df.index
         connection = sqlite3.connect(PARSED_CONFIG.sqlite_db)
-        df[["name_en", "name_ru"]].to_sql(name='City', con=connection, if_exists='append', index=False)
+        columns = {row[1] for row in connection.execute('PRAGMA table_info(City)')}
+        if not columns:
+                df[["name_en", "name_ru", "region"]].to_sql(name='City', con=connection, if_exists='append', index=False)
+                return
+        # the directory is loaded already: the regions of its cities are filled
+        if "region" not in columns:
+                connection.execute('ALTER TABLE City ADD COLUMN region TEXT')
+        connection.executemany('UPDATE City SET region = ? WHERE name_en == ?',
+                               df[["region", "name_en"]].itertuples(index=False, name=None))
+        connection.commit()
 
 def send_excel_to_bot():
         session = AiohttpSession(proxy=PARSED_CONFIG.proxy) if PARSED_CONFIG.proxy else AiohttpSession()
@@ -0,0 +1,117 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+
+class _LoadCancelled(Exception):
+    """The task loading the key was cancelled: the waiters load it again"""
+
+
+class AsyncTTLCache:
+    """
+    Size-bounded (LRU) cache with TTL and single-flight loading:
+    concurrent misses for one key share a single `loader` call
+    """
+
+    def __init__(self, ttl: float, max_size: int):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._loading: dict[Hashable, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self._lookup(key) is not None
+
+    def _lookup(self, key: Hashable) -> Optional[tuple[float, Any]]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        if item[0] < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return item
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        item = self._lookup(key)
+        if item is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return item[1]
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key: Hashable = None):
+        if key is None:
+            self._data.clear()
+        else:
+            self._data.pop(key, None)
+
+    async def get_or_load(
+        self,
+        key: Hashable,
+        loader: Callable[..., Awaitable[Any]],
+        *args,
+        is_cacheable: Callable[[Any], bool] = None,
+        **kwargs,
+    ) -> Any:
+        while True:
+            item = self._lookup(key)
+            if item is not None:
+                self.hits += 1
+                return item[1]
+            if key not in self._loading:
+                break
+            # somebody is already loading this key - wait for his result
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(self._loading[key])
+            except _LoadCancelled:
+                # the first waiter to wake up becomes the loader, the others wait for it
+                continue
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._loading[key] = future
+        try:
+            value = await loader(*args, **kwargs)
+        except asyncio.CancelledError:
+            # only the loader is cancelled, not the waiters sharing its future
+            future.set_exception(_LoadCancelled())
+            future.exception()
+            raise
+        except Exception as err:
+            future.set_exception(err)
+            future.exception()  # mark as retrieved - there may be no waiters at all
+            raise
+        else:
+            if is_cacheable is None or is_cacheable(value):
+                self.set(key, value)
+            future.set_result(value)
+            return value
+        finally:
+            del self._loading[key]
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+        }
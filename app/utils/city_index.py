@@ -0,0 +1,201 @@
+import bisect
+import math
+from collections import Counter, defaultdict
+
+
+def normalize(text: str) -> str:
+    return " ".join(text.lower().replace("ё", "е").replace("-", " ").split())
+
+
+def trigrams(text: str) -> set[str]:
+    text = f" {text} "
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+TRANSLIT = str.maketrans({
+    "а": "a", "б": "b", "в": "v", "г": "g", "д": "d", "е": "e", "ж": "zh", "з": "z", "и": "i", "й": "y",
+    "к": "k", "л": "l", "м": "m", "н": "n", "о": "o", "п": "p", "р": "r", "с": "s", "т": "t", "у": "u",
+    "ф": "f", "х": "kh", "ц": "ts", "ч": "ch", "ш": "sh", "щ": "shch", "ъ": "", "ы": "y", "ь": "", "э": "e",
+    "ю": "yu", "я": "ya",
+})
+
+
+def translit(text: str) -> str:
+    """'москва' -> 'moskva': the russian name typed in latin letters (`name_en` is often the english name)"""
+    return text.translate(TRANSLIT)
+
+
+def deletes(word: str, depth: int) -> set[str]:
+    """The word and all its variants without `depth` letters at most"""
+    result, layer = {word}, {word}
+    for _ in range(depth):
+        layer = {variant[:i] + variant[i + 1:] for variant in layer for i in range(len(variant))}
+        result |= layer
+    return result
+
+
+def typo_distance(left: str, right: str, max_distance: int) -> int:
+    """
+    Damerau-Levenshtein distance (optimal string alignment: substitution, insertion, deletion,
+    transposition of the neighbours); `max_distance + 1` as soon as it is exceeded
+    """
+    if abs(len(left) - len(right)) > max_distance:
+        return max_distance + 1
+    before, previous = None, list(range(len(right) + 1))
+    for i, left_char in enumerate(left, start=1):
+        current = [i] + [0] * len(right)
+        for j, right_char in enumerate(right, start=1):
+            cost = left_char != right_char
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and left_char == right[j - 2] and left[i - 2] == right_char:
+                current[j] = min(current[j], before[j - 2] + 1)
+        if min(current) > max_distance:
+            return max_distance + 1
+        before, previous = previous, current
+    return min(previous[-1], max_distance + 1)
+
+
+class CityIndex:
+    """
+    In-memory index of the City directory (`name_ru` / `name_en`):
+    prefix (binary search), substring, typos (Damerau-Levenshtein over the symmetric delete candidates)
+    and trigram similarity lookup with ranked results; the russian names are also indexed in latin letters
+    """
+
+    EXACT, PREFIX, WORD_PREFIX, SUBSTRING, TYPO, FUZZY = range(6)
+    TYPO_MIN_LEN = 4  # shorter queries are matched by prefix / substring only
+    TYPO_LONG_LEN = 8  # from this length 2 typos are allowed, 1 before
+
+    def __init__(self, min_similarity: float = 0.35):
+        self.min_similarity = min_similarity
+        self.cities: list[dict] = []
+        # every normalized name is an entry: (name, city number, count of trigrams)
+        self._entries: list[tuple[str, int, int]] = []
+        self._sorted: list[tuple[str, int]] = []  # (name, entry number) for the prefix search
+        self._postings: dict[str, list[int]] = defaultdict(list)  # trigram -> entry numbers
+        # the name / its words without 1-2 letters -> entry numbers: the candidates of the typo lookup
+        self._deletes: dict[str, list[int]] = defaultdict(list)
+
+    def __len__(self) -> int:
+        return len(self.cities)
+
+    def build(self, cities: list[dict]):
+        self.cities, self._entries, self._sorted = [], [], []
+        self._postings, self._deletes = defaultdict(list), defaultdict(list)
+        for city in cities:
+            self._add(city)
+        self._sorted.sort()
+
+    def add(self, city: dict):
+        self._add(city)
+        self._sorted.sort()
+
+    def _add(self, city: dict):
+        number = len(self.cities)
+        self.cities.append(city)
+        names = [normalize(city[field]) for field in ("name_ru", "name_en") if city.get(field)]
+        if city.get("name_ru"):
+            names.append(translit(normalize(city["name_ru"])))
+        for name in dict.fromkeys(names):
+            entry = len(self._entries)
+            grams = trigrams(name)
+            self._entries.append((name, number, len(grams)))
+            self._sorted.append((name, entry))
+            for gram in grams:
+                self._postings[gram].append(entry)
+            variants = set()
+            for word in self._words(name):
+                if len(word) >= self.TYPO_MIN_LEN - 1:
+                    # a query of `TYPO_LONG_LEN` letters may have 2 typos against a word 2 letters shorter
+                    variants |= deletes(word, 2 if len(word) >= self.TYPO_LONG_LEN - 2 else 1)
+            for variant in variants:
+                self._deletes[variant].append(entry)
+
+    @staticmethod
+    def _words(name: str) -> list[str]:
+        return list(dict.fromkeys([name, *name.split()]))
+
+    def _prefix(self, query: str) -> list[int]:
+        result = []
+        for name, entry in self._sorted[bisect.bisect_left(self._sorted, (query,)):]:
+            if not name.startswith(query):
+                break
+            result.append(entry)
+        return result
+
+    def max_typos(self, query: str) -> int:
+        if len(query) < self.TYPO_MIN_LEN:
+            return 0
+        return 1 if len(query) < self.TYPO_LONG_LEN else 2
+
+    def _typos(self, query: str) -> dict[int, int]:
+        """Entries whose name or one of its words is `max_typos` edits from the query -> the distance"""
+        max_typos = self.max_typos(query)
+        if not max_typos:
+            return {}
+        # the same variant of the query and of the word without some letters (symmetric delete)
+        entries = set()
+        for variant in deletes(query, max_typos):
+            entries.update(self._deletes.get(variant, ()))
+        result = {}
+        for entry in entries:
+            name = self._entries[entry][0]
+            if query in name:
+                continue  # exact / prefix / substring: ranked above the typos
+            distance = min(typo_distance(word, query, max_typos) for word in self._words(name))
+            if distance <= max_typos:
+                result[entry] = distance
+        return result
+
+    def _rank(self, name: str, query: str, similarity: float, distance: int = None) -> tuple[int, float] | None:
+        if name == query:
+            return self.EXACT, 0.0
+        if name.startswith(query):
+            return self.PREFIX, 0.0
+        if f" {query}" in name:
+            return self.WORD_PREFIX, 0.0
+        if query in name:
+            return self.SUBSTRING, 0.0
+        if distance is not None:
+            # the whole name or one of its words with typos: "масква", "мсоква", "питербург"
+            return self.TYPO, float(distance)
+        if similarity >= self.min_similarity:
+            return self.FUZZY, -similarity
+        return None
+
+    def search(self, query: str, limit: int = 20) -> list[dict]:
+        query = normalize(query)
+        if not query:
+            return []
+        prefix = self._prefix(query)
+        if len(prefix) >= limit:
+            # exact / prefix matches are ranked above everything else
+            return self._ranked(prefix, query, Counter(), 1, limit)
+        query_grams = trigrams(query)
+        shared = Counter()
+        if len(query) >= 3:
+            # every name sharing a trigram with the query is a substring / fuzzy candidate
+            for gram in query_grams:
+                shared.update(self._postings.get(gram, ()))
+        # a substring match shares all inner trigrams, a fuzzy one - `min_similarity` of the query trigrams
+        min_shared = max(1, min(math.ceil(self.min_similarity * len(query_grams)), len(query) - 2))
+        typos = self._typos(query)
+        candidates = {entry for entry, count in shared.items() if count >= min_shared} | set(prefix) | set(typos)
+        if not candidates and len(query) < 3:
+            # the short query has no trigrams: the substring is looked for in all the names
+            candidates = {entry for entry, (name, *_) in enumerate(self._entries) if query in name}
+        return self._ranked(candidates, query, shared, len(query_grams), limit, typos)
+
+    def _ranked(self, candidates, query: str, shared: Counter, query_grams_count: int, limit: int,
+                typos: dict[int, int] = None) -> list[dict]:
+        best: dict[int, tuple] = {}
+        for entry in candidates:
+            name, number, grams_count = self._entries[entry]
+            count = shared.get(entry, 0)
+            rank = self._rank(name, query, count / (query_grams_count + grams_count - count), (typos or {}).get(entry))
+            if rank is not None:
+                key = (rank, len(name), name)
+                if number not in best or key < best[number]:
+                    best[number] = key
+        ranked = sorted(best, key=best.get)
+        return [self.cities[number] for number in ranked[:limit]]
@@ -0,0 +1,111 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+
+class _Burst:
+    __slots__ = ("texts", "context", "first_at", "handle")
+
+    def __init__(self, context: Any):
+        self.texts: list[str] = []
+        self.context = context
+        self.first_at = time.monotonic()
+        self.handle: Optional[asyncio.TimerHandle] = None
+
+
+class Debouncer:
+    """
+    Per-key coalescing of the messages: the texts of one burst are joined with "\\n" and
+    `callback(key, text, context)` is called once - `window` seconds after the last message of the burst
+    (but not later than `max_wait` after the first one). One timer (`loop.call_later`) per key instead of
+    a sleeping coroutine per message; the callbacks of one key run in order
+    """
+
+    def __init__(self, callback: Callable[[Hashable, str, Any], Awaitable], window: float = 1.0,
+                 max_wait: float = 3.0):
+        self.callback = callback
+        self.window = window
+        self.max_wait = max_wait
+        self._bursts: dict[Hashable, _Burst] = {}
+        self._tails: dict[Hashable, asyncio.Task] = {}  # the last callback task of the key
+        self.messages = 0
+        self.flushes = 0
+        self.wait_sum = 0.0
+        self.wait_max = 0.0
+        self.handled = 0
+        self.handle_sum = 0.0
+        self.handle_max = 0.0
+
+    def __len__(self) -> int:
+        return len(self._bursts)
+
+    def push(self, key: Hashable, text: str, context: Any = None, window: Optional[float] = None):
+        """
+        Add the message to the burst of the `key`; `window=0` - no waiting (commands):
+        the pending burst is flushed first, then the message alone
+        """
+        window = self.window if window is None else window
+        self.messages += 1
+        if window <= 0:
+            self.flush(key)
+            burst = _Burst(context)
+            burst.texts.append(text)
+            self._bursts[key] = burst
+            self.flush(key)
+            return
+
+        burst = self._bursts.get(key)
+        if burst is None:
+            burst = self._bursts[key] = _Burst(context)
+        else:
+            burst.handle.cancel()
+            burst.context = context
+        burst.texts.append(text)
+        delay = min(window, burst.first_at + self.max_wait - time.monotonic())
+        burst.handle = asyncio.get_running_loop().call_later(max(delay, 0), self.flush, key)
+
+    def flush(self, key: Hashable):
+        burst = self._bursts.pop(key, None)
+        if burst is None:
+            return
+        if burst.handle is not None:
+            burst.handle.cancel()
+        wait = time.monotonic() - burst.first_at
+        self.flushes += 1
+        self.wait_sum += wait
+        self.wait_max = max(self.wait_max, wait)
+        task = asyncio.get_running_loop().create_task(
+            self._run(key, "\n".join(burst.texts), burst.context, self._tails.get(key))
+        )
+        self._tails[key] = task
+        task.add_done_callback(lambda done: self._tails.pop(key, None) if self._tails.get(key) is done else None)
+
+    async def _run(self, key: Hashable, text: str, context: Any, previous: Optional[asyncio.Task]):
+        if previous is not None:
+            await asyncio.wait([previous])  # the previous burst of the key is handled first
+        start = time.monotonic()
+        try:
+            await self.callback(key, text, context)
+        finally:
+            seconds = time.monotonic() - start
+            self.handled += 1
+            self.handle_sum += seconds
+            self.handle_max = max(self.handle_max, seconds)
+
+    def cancel(self):
+        for burst in self._bursts.values():
+            if burst.handle is not None:
+                burst.handle.cancel()
+        self._bursts.clear()
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._bursts),
+            "messages": self.messages,
+            "flushes": self.flushes,
+            "coalesced": self.messages - self.flushes - sum(len(burst.texts) for burst in self._bursts.values()),
+            "wait_avg": round(self.wait_sum / self.flushes, 3) if self.flushes else 0.0,
+            "wait_max": round(self.wait_max, 3),
+            "handle_avg": round(self.handle_sum / self.handled, 3) if self.handled else 0.0,
+            "handle_max": round(self.handle_max, 3),
+        }
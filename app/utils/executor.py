@@ -0,0 +1,99 @@
+import asyncio
+import importlib
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Optional
+
+from loguru import logger
+
+from app.settings import ExecutorConfig, PARSED_CONFIG
+
+
+def warm_up(modules: tuple[str, ...]):
+    """Initializer of the worker process: the heavy modules are imported before the first task"""
+    for module in modules:
+        importlib.import_module(module)
+
+
+def _worker_ready(hold: float) -> int:
+    time.sleep(hold)  # the task holds its worker: every worker process takes one task
+    return os.getpid()
+
+
+class CpuExecutor:
+    """
+    Process pool for the CPU-bound stages (parsing of the pages, xlsx): the event loop only waits for the result,
+    the stages of the different chats run on all the cores; `func` and its args / result are pickled
+    """
+
+    def __init__(self, config: ExecutorConfig = PARSED_CONFIG.executor):
+        self.config = config
+        self.workers_count = config.workers or os.cpu_count() or 1
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self.submitted = 0
+        self.running = 0
+        self.restarts = 0
+
+    def _start(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers_count,
+                mp_context=multiprocessing.get_context(self.config.start_method),
+                initializer=warm_up,
+                initargs=(tuple(self.config.warm_modules),),
+            )
+        return self._pool
+
+    async def warm(self):
+        """All the worker processes are started and initialized (at startup - not by the first request)"""
+        if not self.config.is_enable:
+            return
+        loop = asyncio.get_running_loop()
+        pool = self._start()
+        pids = await asyncio.gather(
+            *[loop.run_in_executor(pool, _worker_ready, 0.1) for _ in range(self.workers_count)]
+        )
+        logger.info(f"CPU executor: {len(set(pids))} worker processes ({self.config.start_method})")
+
+    async def run(self, func: Callable, *args) -> Any:
+        if not self.config.is_enable:
+            return func(*args)
+        self.submitted += 1
+        self.running += 1
+        loop = asyncio.get_running_loop()
+        pool = self._start()
+        try:
+            try:
+                return await loop.run_in_executor(pool, func, *args)
+            except BrokenProcessPool as err:
+                # a worker process died: the call is retried once in the new pool, the second failure is raised
+                self._restart(pool, err)
+                return await loop.run_in_executor(self._start(), func, *args)
+        finally:
+            self.running -= 1
+
+    def _restart(self, pool: ProcessPoolExecutor, err: BaseException):
+        # the calls broken by the same pool restart it only once
+        if pool is self._pool:
+            logger.error(f"CPU executor: {err}; the pool is restarted")
+            self.restarts += 1
+            self.close()
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers_count if self.config.is_enable else 0,
+            "submitted": self.submitted,
+            "running": self.running,
+            "restarts": self.restarts,
+        }
+
+
+cpu_executor = CpuExecutor()
@@ -0,0 +1,16 @@
+from aioclock import AioClock, Every
+
+from app.services.forecast_prefetch import ForecastPrefetcher
+
+
+def create_scheduler(prefetcher: ForecastPrefetcher) -> AioClock:
+    """
+    Background jobs of the bot (`await app.serve()`)
+    """
+    app = AioClock()
+
+    @app.task(trigger=Every(seconds=prefetcher.config.interval_sec, first_run_strategy="immediate"))
+    async def prefetch_popular_cities():
+        await prefetcher.refresh()
+
+    return app
@@ -1,16 +1,21 @@
 import asyncio
+import datetime
+import functools
+import math
 import os
 import re
 import threading
-from collections.abc import Mapping
+from collections.abc import Iterable, Mapping
 from io import BytesIO
 from pathlib import Path
-from typing import Optional
+from typing import BinaryIO, Optional
 
+import numpy as np
 import pandas as pd
+import xlsxwriter
 import yaml
 from pandas import ExcelWriter, MultiIndex, DataFrame
-from pandas.core.dtypes.common import is_datetime64_any_dtype
+from pandas.core.dtypes.common import is_bool, is_datetime64_any_dtype, is_float, is_integer, is_scalar
 
 path_matcher = re.compile(r"\$\{([^}^{]+)\}")
 
@@ -97,15 +102,31 @@ def clean_html(raw_html: str) -> str:
     return clean_text
 
 
+@functools.lru_cache(maxsize=32)
+def read_static(path: str) -> Optional[bytes]:
+    """Content of the static file (read once), None - no file"""
+    try:
+        with open(path, "rb") as in_file:  # opening for [r]eading as [b]inary
+            return in_file.read()
+    except OSError:
+        return None
+
+
+XLSX_FAST_MAX_ROWS = 5000
+TYPED_ATTR = "is_typed"  # `DataFrame.attrs` flag: the texts are texts, `df_convert_number_to_number` is skipped
+HEADER_FORMAT = {"text_v_align": 2, "align": "center", "text_wrap": True, "bold": True, "fg_color": "#ffcccc", "border": 1}
+
+
 def table_writer(dataframes: dict[Optional[str], DataFrame], param: Optional = "xlsx") -> BytesIO:
+    if param == "xlsx" and all(is_xlsx_fast(dataframe) for dataframe in dataframes.values()):
+        return xlsx_fast_writer(dataframes)
+
     def excellent_header():
         # Get the xlsxwriter workbook and worksheet objects.
         workbook = writer.book
         worksheet = writer.sheets[sheet_name]
         # Add a header format.
-        header_format = workbook.add_format(
-            {"text_v_align": 2, "align": "center", "text_wrap": True, "bold": True, "fg_color": "#ffcccc", "border": 1}
-        )
+        header_format = workbook.add_format(HEADER_FORMAT)
         if isinstance(dataframe.columns, MultiIndex):
             # multilevel header
             for row_num, value in enumerate(dataframe.columns.names):
@@ -117,19 +138,19 @@ def table_writer(dataframes: dict[Optional[str], DataFrame], param: Optional = "
                     worksheet.write(level, col_num + 1, value[level], header_format)
             else:
                 worksheet.write(0, col_num, value, header_format)
-            column_len = dataframe.iloc[:, col_num].astype(str).str.len().max()
-            # Setting the length if the column header is larger than the max column value length (<= 30)
-            column_len = min(max(column_len, len(value) // 2 + 1) + 3, 30)
             # set the column length
-            worksheet.set_column(col_num, col_num, column_len)
+            worksheet.set_column(col_num, col_num, column_width(dataframe.iloc[:, col_num], len(value)))
 
     output = BytesIO()
     if param == "xlsx":
         max_row = 1000000
-        writer = ExcelWriter(output, engine="xlsxwriter")
+        # dates without time (forecast "Дата") are shown as dates
+        datetime_format = "DD.MM.YYYY" if all(map(is_date_only, dataframes.values())) else None
+        writer = ExcelWriter(output, engine="xlsxwriter", datetime_format=datetime_format)
         for count, (name, dataframe) in enumerate(dataframes.items()):
             sheet_name_begin = name if name else f"sheet {count}"
-            sheet_count = int((dataframe.shape[0] - 1) / max_row + 1)
+            # an empty DataFrame is one sheet with the header
+            sheet_count = max(int((dataframe.shape[0] - 1) / max_row + 1), 1)
             # replace dot with comma for Decimal
             dataframe = df_convert_number_to_number(dataframe)
             # dataframe = dataframe.copy().apply(pd.to_numeric, errors="ignore")
@@ -148,20 +169,215 @@ def table_writer(dataframes: dict[Optional[str], DataFrame], param: Optional = "
                 excellent_header()
             # writer.save()
         writer.close()
-    elif param == "csv":
-        for name, dataframe in dataframes.items():
-            dataframe.to_csv(output, index=False)
-            # output.seek(0)
+    elif param in EXPORT_FORMATS:
+        # one table: the header once, the DataFrames are appended as chunks
+        export_writer(dataframes.values(), output, param)
     return output
 
 
+def table_bytes(dataframes: dict[Optional[str], DataFrame], param: Optional = "xlsx") -> bytes:
+    """`table_writer` content as bytes: the result of the process pool call is pickled"""
+    return table_writer(dataframes=dataframes, param=param).getvalue()
+
+
+EXPORT_FORMATS = {"csv": "csv", "parquet": "parquet", "arrow": "arrow"}  # format -> file extension
+
+
+class TableExporter:
+    """
+    Chunked writer of a table into the binary stream: csv, parquet or arrow (IPC stream format);
+    only the current chunk is in memory; `schema` - column -> arrow type (`pyarrow.type_for_alias`),
+    without it the schema is taken from the first chunk (its all-null columns are strings)
+    """
+
+    def __init__(self, output: BinaryIO = None, param: str = "csv", schema: Mapping[str, str] = None):
+        if param not in EXPORT_FORMATS:
+            raise ValueError(f"Unknown export format: `{param}`")
+        self.output = output if output is not None else BytesIO()
+        self.param = param
+        self.schema = schema
+        self.rows = 0
+        self._is_header = True
+        self._arrow_schema = None
+        self._writer = None
+
+    def write(self, df: DataFrame):
+        if self.param == "csv":
+            self.output.write(df.to_csv(index=False, header=self._is_header).encode("utf-8"))
+            self._is_header = False
+        else:
+            self._write_arrow(df)
+        self.rows += df.shape[0]
+
+    def _first_schema(self, df: DataFrame):
+        import pyarrow  # optional dependency (extra "export")
+
+        if self.schema is not None:
+            return pyarrow.schema([(column, pyarrow.type_for_alias(type_)) for column, type_ in self.schema.items()])
+        # the type of an all-null column is `null`: the values of the next chunks would not fit it
+        return pyarrow.schema([
+            field.with_type(pyarrow.string()) if pyarrow.types.is_null(field.type) else field
+            for field in pyarrow.Schema.from_pandas(df, preserve_index=False)
+        ])
+
+    def _write_arrow(self, df: DataFrame):
+        import pyarrow  # optional dependency (extra "export")
+
+        if self._writer is None:
+            self._arrow_schema = self._first_schema(df)
+            if self.param == "parquet":
+                import pyarrow.parquet
+
+                self._writer = pyarrow.parquet.ParquetWriter(self.output, self._arrow_schema)
+            else:
+                self._writer = pyarrow.ipc.new_stream(self.output, self._arrow_schema)
+        self._writer.write_table(pyarrow.Table.from_pandas(df, schema=self._arrow_schema, preserve_index=False))
+
+    def close(self) -> BinaryIO:
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        return self.output
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def export_writer(chunks: Iterable[DataFrame], output: BinaryIO = None, param: str = "csv",
+                  schema: Mapping[str, str] = None) -> BinaryIO:
+    with TableExporter(output, param, schema) as exporter:
+        for chunk in chunks:
+            exporter.write(chunk)
+    return exporter.output
+
+
+def is_xlsx_fast(df: DataFrame) -> bool:
+    """Small sheet with a flat header - written by `xlsx_fast_writer`"""
+    return df.shape[0] <= XLSX_FAST_MAX_ROWS and not isinstance(df.columns, MultiIndex)
+
+
+def text_len(series: pd.Series) -> int:
+    """
+    The longest text of `series.astype(str)`: from the dtype for ints, bools, dates and categories,
+    the other values are converted once per distinct value
+    """
+    if series.empty:
+        return 0
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        codes = np.unique(series.cat.codes.to_numpy())
+        lengths = [len(str(category)) for category in series.cat.categories[codes[codes >= 0]]]
+        return max(lengths + [3] * bool((codes < 0).any()))  # missing - "nan"
+    if isinstance(series.dtype, np.dtype) and series.dtype.kind in "biuM":
+        values = series.to_numpy()
+        if series.dtype.kind == "b":
+            return 4 if values.all() else 5  # "True" / "False"
+        if series.dtype.kind in "iu":
+            return max(len(str(values.min())), len(str(values.max())))
+        present = values[~np.isnat(values)]
+        if not len(present):
+            return 3  # "NaT"
+        if (present == present.astype("datetime64[D]")).all():
+            return 10  # "2026-10-18"
+        if (present == present.astype("datetime64[s]")).all():
+            return 19  # "2026-10-18 10:30:00"
+        return int(series.astype(str).str.len().max())  # the fractions of a second
+    values = series.to_numpy().tolist()
+    try:
+        values = set(values)
+    except TypeError:  # unhashable values
+        pass
+    return max(len(str(value)) for value in values)
+
+
+def column_width(series: pd.Series, header_len: int) -> int:
+    """Width of the xlsx column: the longest text of the values or a half of the header (<= 30)"""
+    # Setting the length if the column header is larger than the max column value length (<= 30)
+    return min(max(text_len(series), header_len // 2 + 1) + 3, 30)
+
+
+def _xlsx_value(value, formats: dict) -> tuple:
+    """
+    Value and cell format as `ExcelWriter` writes them (pandas `_format_value` / `_value_with_fmt`):
+    None - the empty cell, inf - the text, the numbers, bools and dates keep their types, the rest is a text
+    """
+    if is_scalar(value) and pd.isna(value):
+        return None, None
+    if is_float(value) and math.isinf(value):
+        return ("inf" if value > 0 else "-inf"), None
+    if is_integer(value):
+        return int(value), None
+    if is_float(value):
+        return float(value), None
+    if is_bool(value):
+        return bool(value), None
+    if isinstance(value, datetime.datetime):
+        return value, formats["datetime"]
+    if isinstance(value, datetime.date):
+        return value, formats["date"]
+    if isinstance(value, datetime.timedelta):
+        return value.total_seconds() / 86400, formats["days"]
+    return str(value), None
+
+
+def xlsx_fast_writer(dataframes: dict[Optional[str], DataFrame]) -> BytesIO:
+    """
+    xlsx written cell by cell with `xlsxwriter`: the same conversions, cell formats and column widths
+    as the `ExcelWriter` path of `table_writer`, without the pandas formatter; formats created once per workbook
+    """
+    output = BytesIO()
+    workbook = xlsxwriter.Workbook(output, {"in_memory": True})
+    # dates without time (forecast "Дата") are shown as dates
+    datetime_format = "DD.MM.YYYY" if all(map(is_date_only, dataframes.values())) else "YYYY-MM-DD HH:MM:SS"
+    formats = {
+        "header": workbook.add_format(HEADER_FORMAT),
+        "datetime": workbook.add_format({"num_format": datetime_format}),
+        "date": workbook.add_format({"num_format": "YYYY-MM-DD"}),
+        "days": workbook.add_format({"num_format": "0"}),
+    }
+    for count, (name, dataframe) in enumerate(dataframes.items()):
+        worksheet = workbook.add_worksheet(name if name else f"sheet {count}")
+        worksheet.freeze_panes(1, 0)
+        dataframe = df_convert_number_to_number(dataframe)
+        for col_num, header in enumerate(dataframe.columns):
+            worksheet.write(0, col_num, header, formats["header"])
+            worksheet.set_column(col_num, col_num, column_width(dataframe.iloc[:, col_num], len(str(header))))
+        for row_num, row in enumerate(dataframe.itertuples(index=False, name=None), start=1):
+            for col_num, value in enumerate(row):
+                value, cell_format = _xlsx_value(value, formats)
+                if value is not None:
+                    # `write` as `ExcelWriter`: the texts like "=..." / "http..." become formulas / links there too
+                    worksheet.write(row_num, col_num, value, cell_format)
+    workbook.close()
+    return output
+
+
+def is_date_only(df: DataFrame) -> bool:
+    """All the datetime columns of the DataFrame have no time part"""
+    for column in df.columns:
+        series = df[column]
+        if is_datetime64_any_dtype(series):
+            if not isinstance(series.dtype, np.dtype):  # with the time zone
+                series = series.dt.tz_localize(None)
+            values = series.to_numpy()
+            values = values[~np.isnat(values)]
+            if not (values == values.astype("datetime64[D]")).all():
+                return False
+    return True
+
 
 def df_convert_number_to_number(df: DataFrame) -> DataFrame:
+    # the columns of the frame have their types already (`forecast_frame`)
+    if df.attrs.get(TYPED_ATTR):
+        return df
     # replace dot with comma for Decimal
-    if df.shape[0] > 0:
+    # the texts, categories, durations: `to_numeric` keeps the date, number and bool columns as they are
+    columns = [column for column in df.columns if df[column].dtype.kind not in "biufcM"]
+    if df.shape[0] > 0 and columns:
         df = df.copy()
-        # non-date format columns
-        for column in [column for column in df.columns if not is_datetime64_any_dtype(df[column])]:
+        for column in columns:
             # df[column] = df[column].apply(pd.to_numeric, errors="ignore")
             try:
                 df[column] = pd.to_numeric(df[column], errors="raise")
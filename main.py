@@ -1,5 +1,6 @@
 import asyncio
 
+from aioclock import AioClock
 from dependency_injector.wiring import inject, Provide
 from loguru import logger
 
@@ -7,7 +8,7 @@ from app.adapters.db_adapter import WeatherParser
 from app.app_container import ApplicationContainer
 from app.services.main_telegram_service import MainTelegramBotService
 from app.settings import setup_logging, PARSED_CONFIG
-# from app.utils.scheduler import app as app_scheduler
+from app.utils.executor import cpu_executor
 
 
 # def main():
@@ -21,11 +22,30 @@ async def main(
     message_consumer_broker: MainTelegramBotService = Provide[
         ApplicationContainer.main_telegram_bot_service
     ],
+    weather_parser: WeatherParser = Provide[ApplicationContainer.weather_parser],
+    scheduler: AioClock = Provide[ApplicationContainer.scheduler],
 ):
     setup_logging(PARSED_CONFIG.logging)
-    WeatherParser()     # Create DB if not enable
-    consuming_bot = asyncio.create_task(message_consumer_broker.start_bot())
-    await asyncio.gather(consuming_bot)
+    weather_parser.pool.open()     # DB is created in WeatherParser(), open the connection pool
+    await weather_parser.city_index_load()
+    await message_consumer_broker.bot.dialog_state_load()
+    await cpu_executor.warm()     # the worker processes with the parser / xlsx modules imported
+    tasks = [asyncio.create_task(message_consumer_broker.start_bot())]
+    if PARSED_CONFIG.prefetch.is_enable:
+        tasks.append(asyncio.create_task(scheduler.serve()))
+    try:
+        # the bot stopped (signal) or a task failed: the others (the scheduler never returns) are cancelled
+        done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        for task in done:
+            task.result()
+    finally:
+        # the dialogs are resumed after the restart
+        await message_consumer_broker.bot.dialog_state_save()
+        await message_consumer_broker.close()
+        weather_parser.close()
 
 
 if __name__ == "__main__":